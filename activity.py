@@ -0,0 +1,95 @@
+import asyncio
+import time
+from functools import partial
+
+
+class ActivitySession:
+    """One continuous run of the same user action (typing, recording, ...)"""
+    __slots__ = ('key', 'emoji', 'text', 'started_at', 'started', 'last_seen', 'updates', 'watcher')
+
+    def __init__(self, key, emoji, text):
+        now = time.monotonic()
+        self.key = key
+        self.emoji = emoji
+        self.text = text
+        self.started_at = time.time()  # Wall clock, for display
+        self.started = now
+        self.last_seen = now
+        self.updates = 1
+        self.watcher = None
+
+    @property
+    def duration(self):
+        """Seconds between the first and the last update of the session"""
+        return self.last_seen - self.started
+
+
+class ActivitySessions:
+    """Coalesce repeated action updates into sessions keyed by action type
+
+    Clients resend an action every few seconds while it lasts. The first
+    update of a key opens a session and calls `on_start`; repeats only
+    extend it. Once no update has arrived for `idle_timeout` seconds the
+    session is closed and `on_end` is called with the full session.
+    """
+
+    def __init__(self, idle_timeout, on_start, on_end, supervisor):
+        self.idle_timeout = idle_timeout
+        self.on_start = on_start
+        self.on_end = on_end
+        self.supervisor = supervisor  # Runs the per-session watchers
+        self.sessions = {}
+
+        # Counters
+        self.started = 0
+        self.ended = 0
+        self.suppressed = 0
+
+    async def observe(self, key, emoji, text):
+        """Record one action update"""
+        session = self.sessions.get(key)
+        if session:
+            session.last_seen = time.monotonic()
+            session.updates += 1
+            self.suppressed += 1
+            return
+
+        session = ActivitySession(key, emoji, text)
+        self.sessions[key] = session
+        self.started += 1
+        session.watcher = self.supervisor.spawn(f'activity watcher ({session.text})', partial(self._watch, session))
+        await self.on_start(session)
+
+    async def _watch(self, session):
+        """Sleep until the session has been idle long enough, then close it"""
+        while True:
+            remaining = session.last_seen + self.idle_timeout - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        await self._end(session)
+
+    async def _end(self, session):
+        if self.sessions.get(session.key) is not session:
+            return
+        del self.sessions[session.key]
+        self.ended += 1
+        try:
+            await self.on_end(session)
+        except Exception as e:
+            print(f"Error closing activity session: {e}")
+
+    async def close(self):
+        """Close all open sessions immediately"""
+        for session in list(self.sessions.values()):
+            session.watcher.cancel()
+            await self._end(session)
+
+    def stats(self):
+        """Snapshot of session counters"""
+        return {
+            'active': len(self.sessions),
+            'started': self.started,
+            'ended': self.ended,
+            'suppressed': self.suppressed,
+        }
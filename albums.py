@@ -0,0 +1,82 @@
+import asyncio
+import time
+from functools import partial
+
+# Telegram allows at most ten items per album
+MAX_ALBUM_SIZE = 10
+
+
+class PendingAlbum:
+    """Messages of one album gathered so far"""
+    __slots__ = ('grouped_id', 'items', 'last_seen', 'watcher')
+
+    def __init__(self, grouped_id):
+        self.grouped_id = grouped_id
+        self.items = []
+        self.last_seen = time.monotonic()
+        self.watcher = None
+
+
+class AlbumBatcher:
+    """Gather the messages of an album, which arrive as separate events
+
+    Items are grouped by `grouped_id`. Once no new item has arrived for
+    `window` seconds (or the album is full), `on_album` is called once
+    with all items in message id order.
+    """
+
+    def __init__(self, window, on_album, supervisor):
+        self.window = window
+        self.on_album = on_album
+        self.supervisor = supervisor  # Runs the per-album watchers
+        self.pending = {}
+
+        # Counters
+        self.albums = 0
+        self.items = 0
+
+    async def add(self, grouped_id, message_id, item):
+        """Add one message of an album"""
+        album = self.pending.get(grouped_id)
+        if album is None:
+            album = self.pending[grouped_id] = PendingAlbum(grouped_id)
+            album.watcher = self.supervisor.spawn(f'album watcher {grouped_id}', partial(self._watch, album))
+        album.items.append((message_id, item))
+        album.last_seen = time.monotonic()
+        self.items += 1
+        if len(album.items) >= MAX_ALBUM_SIZE:
+            album.watcher.cancel()
+            await self._flush(album)
+
+    async def _watch(self, album):
+        """Sleep until the album has been quiet for the window, then hand it over"""
+        while True:
+            remaining = album.last_seen + self.window - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        await self._flush(album)
+
+    async def _flush(self, album):
+        if self.pending.get(album.grouped_id) is not album:
+            return
+        del self.pending[album.grouped_id]
+        self.albums += 1
+        album.items.sort(key=lambda entry: entry[0])
+        try:
+            await self.on_album([item for _, item in album.items])
+        except Exception as e:
+            print(f"Error handling album: {e}")
+
+    async def close(self):
+        """Hand over all pending albums immediately"""
+        for album in list(self.pending.values()):
+            album.watcher.cancel()
+            await self._flush(album)
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'albums': self.albums,
+            'items': self.items,
+        }
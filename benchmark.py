@@ -0,0 +1,415 @@
+"""Offline event-replay benchmark for TelegramTracker
+
+Feeds synthetic NewMessage, MessageEdited, MessageDeleted and UserUpdate
+events through the tracker's real handlers using an in-process stand-in
+for TelegramClient, and prints a JSON report (events/sec, per-event-type
+handler latency, outbound call counts and a digest of every outbound
+text/caption, peak RSS). Compare `outbound.payload_digest` between runs
+with the same seed to check that an optimization did not change output;
+write the payloads themselves with --payloads to diff them.
+
+    python benchmark.py --events 20000 --mix new=50,edit=15,delete=10,action=25
+    python benchmark.py --rate 200 --output run.json
+    python benchmark.py --payloads before.jsonl
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from telethon import events
+from telethon.tl import types
+
+import tracker
+
+TARGET_ID = 1000001
+OTHER_ID = 1000002
+CHAT_ID = TARGET_ID  # Private chat with the target
+
+ACTIONS = [
+    types.SendMessageTypingAction,
+    types.SendMessageRecordAudioAction,
+    lambda: types.SendMessageUploadPhotoAction(progress=50),
+    types.SendMessageRecordVideoAction,
+]
+
+
+class FakeFile:
+    def __init__(self, size):
+        self.size = size
+        self.name = None
+        self.ext = '.jpg'
+
+
+class FakeMessage:
+    """Just enough of telethon's Message for the tracker"""
+
+    def __init__(self, message_id, text, media_id=None, media_size=0, grouped_id=None):
+        self.id = message_id
+        self.chat_id = CHAT_ID
+        self.text = text
+        self.grouped_id = grouped_id
+        self.media = None
+        self.photo = None
+        self.video = None
+        self.voice = None
+        self.audio = None
+        self.document = None
+        self.gif = None
+        self.sticker = None
+        self.video_note = None
+        self.file = None
+        if media_id is not None:
+            self.photo = types.Photo(
+                id=media_id, access_hash=0, file_reference=b'', date=None, sizes=[], dc_id=1
+            )
+            self.media = types.MessageMediaPhoto(photo=self.photo)
+            self.file = FakeFile(media_size)
+
+    async def download_media(self, file=None, progress_callback=None):
+        data = b'\0' * self.file.size
+        if file is bytes:
+            return data
+        with open(file, 'wb') as f:
+            f.write(data)
+        return file
+
+
+class FakeEvent:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeClient:
+    """In-process stand-in for TelegramClient that records outbound calls"""
+
+    def __init__(self, target, reference_failure_rate=0.0):
+        self.target = target
+        self.reference_failure_rate = reference_failure_rate
+        self.handlers = []
+        self.calls = Counter()
+        self.bytes_uploaded = 0
+        self.messages = {}  # Sent by the generator, for get_messages()
+        self.payloads = []  # (call, chat, text or caption) of everything sent
+
+    def on(self, builder):
+        def decorator(callback):
+            self.handlers.append((builder, callback))
+            return callback
+        return decorator
+
+    def remove_event_handler(self, callback):
+        self.handlers = [(builder, handler) for builder, handler in self.handlers if handler is not callback]
+
+    async def start(self):
+        return self
+
+    async def get_messages(self, chat, ids):
+        return [self.messages.get(message_id) for message_id in ids]
+
+    async def get_entity(self, query):
+        if query in (TARGET_ID, self.target.username):
+            return self.target
+        raise ValueError(f"Unknown entity {query!r}")
+
+    async def iter_dialogs(self):
+        yield FakeEvent(entity=self.target)
+
+    async def send_message(self, chat, message):
+        self.calls['send_message'] += 1
+        self.payloads.append(('send_message', str(chat), message))
+
+    async def send_file(self, chat, file, caption=None, progress_callback=None):
+        self.payloads.append(('send_file', str(chat), caption))
+        if isinstance(file, list):
+            self.calls['send_file_album'] += 1
+            return [await self._send_one(item) for item in file]
+        self.calls['send_file'] += 1
+        return await self._send_one(file)
+
+    async def _send_one(self, file):
+        if isinstance(file, types.MessageMediaPhoto):
+            self.calls['send_file_reference'] += 1
+            if random.random() < self.reference_failure_rate:
+                raise ValueError("File reference expired")
+            return FakeEvent(media=file)
+
+        self.calls['send_file_upload'] += 1
+        data = file.getvalue() if hasattr(file, 'getvalue') else b''
+        self.bytes_uploaded += len(data)
+        # The uploaded copy gets a new server-side id, like a real upload
+        photo = types.Photo(
+            id=random.getrandbits(62), access_hash=0, file_reference=b'', date=None, sizes=[], dc_id=1
+        )
+        return FakeEvent(media=types.MessageMediaPhoto(photo=photo))
+
+    def handlers_for(self, builder_type, event):
+        """Handlers that would fire for an event, applying the builders' sender filters"""
+        for builder, callback in self.handlers:
+            if type(builder) is not builder_type:
+                continue
+            # Mimic the from_users filter Telethon applies before dispatch
+            if builder_type in (events.NewMessage, events.MessageEdited):
+                if getattr(event, 'sender_id', None) != TARGET_ID:
+                    continue
+            yield callback
+
+
+# Clock readings and measured durations differ on every run
+VOLATILE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{3})?|Duration: [\d.]+s')
+
+
+def normalized_payloads(payloads):
+    """Outbound payloads with times masked, sorted so concurrent sends compare equal"""
+    return sorted(
+        (call, chat, VOLATILE.sub('<time>', text) if text else text)
+        for call, chat, text in payloads
+    )
+
+
+def payload_digest(payloads):
+    digest = hashlib.sha256()
+    for payload in payloads:
+        digest.update(json.dumps(payload, ensure_ascii=False).encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class EventGenerator:
+    """Synthetic event stream with a configurable mix"""
+
+    def __init__(self, mix, media_ratio, other_ratio, seed, album_ratio=0.0):
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.media_ratio = media_ratio
+        self.album_ratio = album_ratio
+        self.album_queue = []  # Remaining items of an album being sent
+        self.other_ratio = other_ratio
+        self.random = random.Random(seed)
+        self.next_id = 1
+        self.live_ids = []
+
+    def _text(self):
+        return ' '.join('lorem' for _ in range(self.random.randint(1, 40)))
+
+    def _album(self):
+        """Queue the events of a 2-10 item album from the target"""
+        grouped_id = self.random.getrandbits(62)
+        for _ in range(self.random.randint(2, 10)):
+            message_id = self.next_id
+            self.next_id += 1
+            message = FakeMessage(message_id, '', self.random.randint(1, 50),
+                                  self.random.randint(1, 64) * 1024, grouped_id)
+            self.live_ids.append(message_id)
+            self.album_queue.append(FakeEvent(message=message, sender_id=TARGET_ID, chat_id=CHAT_ID))
+
+    def next(self):
+        if self.album_queue:
+            return 'album', events.NewMessage, self.album_queue.pop(0)
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind in ('edit', 'delete') and not self.live_ids:
+            kind = 'new'
+
+        if kind == 'new':
+            message_id = self.next_id
+            self.next_id += 1
+            sender = OTHER_ID if self.random.random() < self.other_ratio else TARGET_ID
+            media_id = None
+            if sender == TARGET_ID and self.random.random() < self.media_ratio * self.album_ratio:
+                self._album()
+                return self.next()
+            if self.random.random() < self.media_ratio:
+                # Small pool of ids so repeated stickers/photos exercise the dedup cache
+                media_id = self.random.randint(1, 50)
+            message = FakeMessage(message_id, self._text(), media_id, self.random.randint(1, 64) * 1024)
+            if sender == TARGET_ID:
+                self.live_ids.append(message_id)
+            return kind, events.NewMessage, FakeEvent(message=message, sender_id=sender, chat_id=CHAT_ID)
+
+        if kind == 'edit':
+            message = FakeMessage(self.random.choice(self.live_ids), self._text())
+            return kind, events.MessageEdited, FakeEvent(message=message, sender_id=TARGET_ID, chat_id=CHAT_ID)
+
+        if kind == 'delete':
+            message_id = self.live_ids.pop(self.random.randrange(len(self.live_ids)))
+            return kind, events.MessageDeleted, FakeEvent(deleted_ids=[message_id], chat_id=None)
+
+        user_id = OTHER_ID if self.random.random() < self.other_ratio else TARGET_ID
+        action = self.random.choice(ACTIONS)()
+        return kind, events.UserUpdate, FakeEvent(user_id=user_id, action=action)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 4) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 4) if values else None,
+        'max_ms': round(values[-1] * 1000, 4) if values else None,
+    }
+
+
+def configure(workdir, log_rate):
+    """Point the tracker's module settings at a scratch directory"""
+    tracker.TARGET_USER = TARGET_ID
+    tracker.LOG_CHAT_ID = 'me'
+    tracker.DOWNLOAD_DIR = os.path.join(workdir, 'downloads')
+    tracker.ENTITY_CACHE_PATH = None
+    tracker.UNFINISHED_WORK_PATH = os.path.join(workdir, 'unfinished.json')
+    tracker.MESSAGE_STORE_PATH = os.path.join(workdir, 'messages.db')
+    tracker.ARCHIVE_DIR = os.path.join(workdir, 'archive')
+    tracker.LOG_RATE_PER_SECOND = log_rate
+    tracker.LOG_RATE_BURST = max(1, int(log_rate))
+    tracker.METRICS_PORT = None
+    tracker.METRICS_SUMMARY_INTERVAL = None
+
+
+async def replay(args):
+    target = types.User(id=TARGET_ID, access_hash=1, first_name='Target', username='target')
+    client = FakeClient(target, args.reference_failure_rate)
+    generator = EventGenerator(args.mix, args.media_ratio, args.other_ratio, args.seed, args.album_ratio)
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, 'w') as devnull:
+        configure(workdir, args.log_rate)
+        # Console output would dominate the measurement
+        with contextlib.redirect_stdout(devnull):
+            bot = tracker.TelegramTracker(client=client)
+            if not await bot.start():
+                raise RuntimeError("Tracker failed to start against the fake client")
+
+            latencies = {}
+            counts = Counter()
+            interval = 1.0 / args.rate if args.rate else 0.0
+            started = time.perf_counter()
+            for n in range(args.events):
+                kind, builder_type, event = generator.next()
+                counts[kind] += 1
+                for callback in client.handlers_for(builder_type, event):
+                    handler_started = time.perf_counter()
+                    await callback(event)
+                    latencies.setdefault(kind, []).append(time.perf_counter() - handler_started)
+                if interval:
+                    # Pace against the schedule rather than sleeping a fixed amount per event
+                    delay = started + (n + 1) * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif n % 100 == 0:
+                    await asyncio.sleep(0)  # Let background workers run
+            elapsed = time.perf_counter() - started
+
+            drain_started = time.perf_counter()
+            components = {
+                'message_cache': bot.message_cache.stats(),
+                'activity_sessions': bot.activity_sessions.stats(),
+            }
+            await bot.close()
+            drain_time = time.perf_counter() - drain_started
+            components['log_queue'] = bot.log_queue.stats()
+            components['media_pipeline'] = bot.media_pipeline.stats()
+            components['albums'] = bot.album_batcher.stats()
+            if bot.message_store:
+                components['message_store'] = bot.message_store.stats()
+            for sink in bot.sinks:
+                if hasattr(sink, 'stats'):
+                    components[type(sink).__name__] = sink.stats()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    payloads = normalized_payloads(client.payloads)
+    if args.payloads:
+        with open(args.payloads, 'w') as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+    return {
+        'config': {
+            'events': args.events,
+            'rate': args.rate,
+            'mix': args.mix,
+            'media_ratio': args.media_ratio,
+            'album_ratio': args.album_ratio,
+            'other_ratio': args.other_ratio,
+            'log_rate': args.log_rate,
+            'reference_failure_rate': args.reference_failure_rate,
+            'seed': args.seed,
+            'uvloop': args.uvloop,
+        },
+        'elapsed_s': round(elapsed, 4),
+        'startup_ms': {name: round(seconds * 1000, 2) for name, seconds in bot.startup_phases},
+        'drain_s': round(drain_time, 4),
+        'events_per_sec': round(args.events / elapsed, 1) if elapsed else None,
+        'events': dict(counts),
+        'latency': {
+            'all': summarize(all_latencies),
+            **{kind: summarize(values) for kind, values in sorted(latencies.items())},
+        },
+        'outbound': {
+            **client.calls,
+            'bytes_uploaded': client.bytes_uploaded,
+            'payloads': len(payloads),
+            'payload_digest': payload_digest(payloads),
+        },
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'components': components,
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in ('new', 'edit', 'delete', 'action'):
+            raise argparse.ArgumentTypeError(f"unknown event kind {kind!r}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=10000, help='number of events to replay')
+    parser.add_argument('--rate', type=float, default=0, help='target events/sec (0 = as fast as possible)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('new=50,edit=15,delete=10,action=25'),
+                        help='relative weights, e.g. new=50,edit=15,delete=10,action=25')
+    parser.add_argument('--media-ratio', type=float, default=0.1, help='fraction of new messages with media')
+    parser.add_argument('--album-ratio', type=float, default=0.0,
+                        help='fraction of media messages that start a 2-10 item album')
+    parser.add_argument('--other-ratio', type=float, default=0.2,
+                        help='fraction of messages/actions from users other than the target')
+    parser.add_argument('--log-rate', type=float, default=1e6,
+                        help='outbound log rate limit (default effectively unlimited)')
+    parser.add_argument('--reference-failure-rate', type=float, default=0.0,
+                        help='fraction of by-reference media sends that fail and fall back to upload')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--uvloop', action='store_true', help='run on the uvloop event loop')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--payloads', help='also write every outbound text/caption (times masked) here as JSON lines')
+    args = parser.parse_args()
+
+    if args.uvloop:
+        tracker.install_uvloop()
+    report = asyncio.run(replay(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
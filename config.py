@@ -19,3 +19,75 @@ LOG_CHAT_ID = int(os.getenv('LOG_CHAT_ID')) if os.getenv('LOG_CHAT_ID') else Non
 # Download directory for media files
 DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR', 'downloads')
 
+# Resolved target user / log chat (ids and access hashes) for fast restarts (empty to disable)
+ENTITY_CACHE_PATH = os.getenv('ENTITY_CACHE_PATH', 'entities.json') or None
+
+
+# Message cache limits (edit/delete detection only works for cached messages)
+MESSAGE_CACHE_MAX_ENTRIES = int(os.getenv('MESSAGE_CACHE_MAX_ENTRIES', '50000'))
+MESSAGE_CACHE_MAX_BYTES = int(os.getenv('MESSAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+MESSAGE_CACHE_TTL = int(os.getenv('MESSAGE_CACHE_TTL', str(7 * 24 * 3600))) or None
+
+# Persistent message store so edit/delete detection survives restarts (empty to disable)
+MESSAGE_STORE_PATH = os.getenv('MESSAGE_STORE_PATH', 'messages.db') or None
+MESSAGE_STORE_BATCH_SIZE = int(os.getenv('MESSAGE_STORE_BATCH_SIZE', '200'))
+MESSAGE_STORE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_STORE_FLUSH_INTERVAL', '1.0'))
+# Full-text index of stored messages, queried with search.py (0 to disable)
+MESSAGE_STORE_SEARCH_INDEX = os.getenv('MESSAGE_STORE_SEARCH_INDEX', '1') != '0'
+
+# Outbound log queue (Telegram allows roughly one message per second per chat)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '1000'))
+LOG_RATE_PER_SECOND = float(os.getenv('LOG_RATE_PER_SECOND', '1.0'))
+LOG_RATE_BURST = int(os.getenv('LOG_RATE_BURST', '5'))
+LOG_MAX_RETRIES = int(os.getenv('LOG_MAX_RETRIES', '5'))
+LOG_PUT_TIMEOUT = float(os.getenv('LOG_PUT_TIMEOUT', '5.0'))
+LOG_DRAIN_TIMEOUT = float(os.getenv('LOG_DRAIN_TIMEOUT', '10.0'))
+
+# Seconds without a repeat before a typing/recording session is considered over
+ACTIVITY_IDLE_TIMEOUT = float(os.getenv('ACTIVITY_IDLE_TIMEOUT', '8.0'))
+
+# Media download/re-upload workers
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', '3'))
+MEDIA_MEMORY_THRESHOLD = int(os.getenv('MEDIA_MEMORY_THRESHOLD', str(10 * 1024 * 1024)))
+MEDIA_QUEUE_SIZE = int(os.getenv('MEDIA_QUEUE_SIZE', '100'))
+MEDIA_DRAIN_TIMEOUT = float(os.getenv('MEDIA_DRAIN_TIMEOUT', '30.0'))
+# Seconds to wait for the rest of an album before copying it as one
+ALBUM_WINDOW = float(os.getenv('ALBUM_WINDOW', '0.6'))
+MEDIA_DEDUP_MAX_ENTRIES = int(os.getenv('MEDIA_DEDUP_MAX_ENTRIES', '5000'))
+
+# Content-addressed media files in DOWNLOAD_DIR: disk quota and max idle age (0 to keep forever)
+MEDIA_STORE_MAX_BYTES = int(os.getenv('MEDIA_STORE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+MEDIA_STORE_MAX_AGE = int(os.getenv('MEDIA_STORE_MAX_AGE', str(30 * 24 * 3600))) or None
+
+# Background workers are restarted with exponential backoff if they crash
+HANDLER_CONCURRENCY = int(os.getenv('HANDLER_CONCURRENCY', '64'))
+WORKER_RESTART_BACKOFF = float(os.getenv('WORKER_RESTART_BACKOFF', '1.0'))
+WORKER_RESTART_MAX_BACKOFF = float(os.getenv('WORKER_RESTART_MAX_BACKOFF', '60.0'))
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '45.0'))  # Seconds to drain on SIGTERM/SIGINT
+UNFINISHED_WORK_PATH = os.getenv('UNFINISHED_WORK_PATH', 'unfinished.json') or None
+
+# Run on uvloop's faster event loop when it is installed (pip install uvloop)
+USE_UVLOOP = os.getenv('USE_UVLOOP', '0') == '1'
+
+# Prometheus-style metrics on http://METRICS_HOST:METRICS_PORT/ (port 0 to disable)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464')) or None
+METRICS_SUMMARY_INTERVAL = int(os.getenv('METRICS_SUMMARY_INTERVAL', '600')) or None
+
+# Catch-up on edits/deletes/messages missed while the tracker was down (needs the message store)
+CATCHUP_MAX_MESSAGES = int(os.getenv('CATCHUP_MAX_MESSAGES', '1000'))
+CATCHUP_RECHECK_LIMIT = int(os.getenv('CATCHUP_RECHECK_LIMIT', '500'))
+CATCHUP_BATCH_DELAY = float(os.getenv('CATCHUP_BATCH_DELAY', '1.0'))
+
+# What reaches the log chat: 'full' (every log and media file), 'summary'
+# (start/stop plus a periodic activity count) or 'off'
+TELEGRAM_LOG_MODE = os.getenv('TELEGRAM_LOG_MODE', 'full')
+TELEGRAM_SUMMARY_INTERVAL = int(os.getenv('TELEGRAM_SUMMARY_INTERVAL', '3600'))
+
+# Local archive of every log record as compressed, rotating JSONL files (empty to disable)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive') or None
+ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'gzip')
+ARCHIVE_MAX_BYTES = int(os.getenv('ARCHIVE_MAX_BYTES', str(64 * 1024 * 1024)))
+ARCHIVE_MAX_AGE = int(os.getenv('ARCHIVE_MAX_AGE', str(24 * 3600)))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '100'))
+ARCHIVE_FLUSH_INTERVAL = float(os.getenv('ARCHIVE_FLUSH_INTERVAL', '2.0'))
@@ -0,0 +1,187 @@
+import json
+import re
+import sys
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Words, runs of whitespace and single punctuation marks
+TOKEN_RE = re.compile(r'\s+|\w+|[^\w\s]')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text or '')
+
+
+def _opcodes(a, b):
+    """difflib opcodes for two token lists, skipping the common prefix and suffix
+
+    Most edits touch a small part of a message, so only the changed middle
+    goes through SequenceMatcher (which is quadratic on repetitive text).
+    """
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    opcodes = [('equal', 0, prefix, 0, prefix)] if prefix else []
+    a_end, b_end = len(a) - suffix, len(b) - suffix
+    if prefix < a_end or prefix < b_end:
+        if prefix == a_end or prefix == b_end:
+            opcodes.append(('replace', prefix, a_end, prefix, b_end))
+        else:
+            matcher = SequenceMatcher(None, a[prefix:a_end], b[prefix:b_end], autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+    if suffix:
+        opcodes.append(('equal', a_end, len(a), b_end, len(b)))
+    return opcodes
+
+
+@lru_cache(maxsize=16)
+def _compare(old, new):
+    """Tokens and opcodes for a pair of texts; cached because an edit is both stored and rendered"""
+    a, b = tokenize(old), tokenize(new)
+    return a, b, _opcodes(a, b)
+
+
+def make_delta(old, new):
+    """Compact delta turning `old` into `new`
+
+    A list of ops applied left to right: a positive int keeps that many
+    characters, a negative int skips (deletes) that many, a string is
+    inserted. Adjacent ops of the same kind are merged.
+    """
+    a, b, opcodes = _compare(old or '', new or '')
+    delta = []
+
+    def push(op):
+        if delta and type(delta[-1]) is type(op) and (isinstance(op, str) or (delta[-1] > 0) == (op > 0)):
+            delta[-1] += op
+        else:
+            delta.append(op)
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            push(sum(map(len, a[i1:i2])))
+            continue
+        if i2 > i1:
+            push(-sum(map(len, a[i1:i2])))
+        if j2 > j1:
+            push(''.join(b[j1:j2]))
+
+    # A trailing keep is implied
+    if delta and isinstance(delta[-1], int) and delta[-1] > 0:
+        delta.pop()
+    return delta
+
+
+def apply_delta(old, delta):
+    """Rebuild the newer text from `old` and a delta from make_delta()"""
+    old = old or ''
+    parts = []
+    position = 0
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.append(old[position:position + op])
+            position += op
+        else:
+            position -= op
+    parts.append(old[position:])
+    return ''.join(parts)
+
+
+def _mark(marker, text):
+    """Wrap text in a markdown marker, leaving surrounding whitespace outside it"""
+    stripped = text.strip()
+    if not stripped:
+        return text
+    start = text.index(stripped)
+    return f"{text[:start]}{marker}{stripped}{marker}{text[start + len(stripped):]}"
+
+
+def render_diff(old, new):
+    """Word-level diff in Telegram markdown: ~~removed~~ and **added**"""
+    a, b, opcodes = _compare(old or '', new or '')
+    parts = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            parts.append(''.join(a[i1:i2]))
+            continue
+        removed = ''.join(a[i1:i2])
+        added = ''.join(b[j1:j2])
+        if not removed.strip() and not added.strip():
+            parts.append(added)  # Whitespace-only change
+            continue
+        if removed.strip():
+            parts.append(_mark('~~', removed))
+        if added.strip():
+            parts.append(_mark('**', added))
+        elif not removed.strip():
+            parts.append(added)
+    return ''.join(parts)
+
+
+class EditHistory:
+    """Version chain of a message: the original text in full, then one delta per edit
+
+    The latest text is not kept here (the cache record already holds it);
+    any version can be rebuilt by replaying deltas over the original.
+    """
+    __slots__ = ('original', 'deltas', 'bytes')
+
+    def __init__(self, original, deltas=None):
+        self.original = original
+        self.deltas = deltas or []
+        self.bytes = sys.getsizeof(original) if original else 0
+        for delta in self.deltas:
+            self.bytes += self._delta_size(delta)
+
+    @staticmethod
+    def _delta_size(delta):
+        return sys.getsizeof(delta) + sum(sys.getsizeof(op) for op in delta)
+
+    def __len__(self):
+        """Number of edits"""
+        return len(self.deltas)
+
+    def append(self, previous, new):
+        """Record an edit from `previous` (the current latest text) to `new`"""
+        delta = make_delta(previous, new)
+        self.deltas.append(delta)
+        self.bytes += self._delta_size(delta)
+
+    def version(self, index):
+        """Text of a version: 0 is the original, -1 the latest"""
+        if index < 0:
+            index += len(self.deltas) + 1
+        if not 0 <= index <= len(self.deltas):
+            raise IndexError(f"message has no version {index}")
+        text = self.original or ''
+        for delta in self.deltas[:index]:
+            text = apply_delta(text, delta)
+        return text
+
+    def versions(self):
+        """All versions, original first"""
+        text = self.original or ''
+        yield text
+        for delta in self.deltas:
+            text = apply_delta(text, delta)
+            yield text
+
+    def size(self):
+        """Approximate memory footprint in bytes"""
+        return sys.getsizeof(self) + sys.getsizeof(self.deltas) + self.bytes
+
+    def dumps(self):
+        """JSON form of the deltas, for the message store"""
+        return json.dumps(self.deltas, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, original, deltas):
+        return cls(original, json.loads(deltas) if deltas else [])
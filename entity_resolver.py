@@ -0,0 +1,195 @@
+import json
+import os
+import time
+
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+
+class EntityResolver:
+    """Resolve the target user and log chat with as few round trips as possible
+
+    Each entity is looked up, in order, from the local cache of input peers
+    (id + access hash), then by a direct id/username lookup, and only then
+    by scanning dialogs. A scan looks for everything still missing in a
+    single pass and stops as soon as it has found it all.
+
+    A bare name (no @) may be a first name, which a direct lookup would
+    resolve as somebody else's username; a direct hit for one is only kept
+    when it is one of your contacts, otherwise the scan decides.
+    """
+
+    def __init__(self, client, cache_path='entities.json'):
+        self.client = client
+        self.cache_path = cache_path
+        self.cache = self._load()
+        self.timings = {}  # Phase -> seconds
+        self.sources = {}  # Cache key -> where the entity came from
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable entity cache: {e}")
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.cache, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️  Could not save entity cache: {e}")
+
+    @staticmethod
+    def key(kind, query):
+        return f"{kind}:{query}"
+
+    def _remember(self, key, entity, source):
+        peer = utils.get_input_peer(entity)
+        if isinstance(peer, InputPeerUser):
+            self.cache[key] = {'type': 'user', 'id': peer.user_id, 'access_hash': peer.access_hash}
+        elif isinstance(peer, InputPeerChannel):
+            self.cache[key] = {'type': 'channel', 'id': peer.channel_id, 'access_hash': peer.access_hash}
+        elif isinstance(peer, InputPeerChat):
+            self.cache[key] = {'type': 'chat', 'id': peer.chat_id}
+        else:
+            return
+        self.cache[key]['source'] = source  # 'lookup' or 'scan'
+
+    @staticmethod
+    def _input_peer(entry):
+        if entry['type'] == 'user':
+            return InputPeerUser(entry['id'], entry['access_hash'])
+        if entry['type'] == 'channel':
+            return InputPeerChannel(entry['id'], entry['access_hash'])
+        return InputPeerChat(entry['id'])
+
+    @staticmethod
+    def matches_user(entity, query):
+        """Same matching rules as the original dialog scan: id, username or first name"""
+        if isinstance(query, int):
+            return getattr(entity, 'id', None) == query
+        query = query.lower()
+        username = getattr(entity, 'username', None)
+        if username and username.lower() == query.replace('@', ''):
+            return True
+        first_name = getattr(entity, 'first_name', None)
+        return bool(first_name and first_name.lower() == query)
+
+    @staticmethod
+    def is_name(query):
+        """A string without @: a username or a first name"""
+        return isinstance(query, str) and not query.startswith('@')
+
+    @staticmethod
+    def matches_chat(entity, chat_id):
+        """Match a chat by marked peer id (-100... for channels) or raw id"""
+        return utils.get_peer_id(entity) == chat_id or getattr(entity, 'id', None) == chat_id
+
+    async def _timed(self, phase, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+
+    async def _from_cache(self, key, query):
+        entry = self.cache.get(key)
+        if not entry:
+            return None
+        if 'source' not in entry and self.is_name(query):
+            # Saved before names were checked; it may be a stranger with that username
+            self.cache.pop(key, None)
+            return None
+        try:
+            return await self.client.get_entity(self._input_peer(entry))
+        except Exception:
+            # Stale access hash or entity no longer reachable
+            self.cache.pop(key, None)
+            return None
+
+    async def _direct(self, query):
+        try:
+            entity = await self.client.get_entity(query)
+        except Exception:
+            return None
+        if self.is_name(query) and not getattr(entity, 'contact', False):
+            return None
+        return entity
+
+    async def _scan(self, wanted):
+        """Find every wanted entity in one pass over the dialogs
+
+        `wanted` maps cache keys to match predicates. Returns the found
+        entities by key and the number of dialogs scanned.
+        """
+        found = {}
+        dialog_count = 0
+        async for dialog in self.client.iter_dialogs():
+            dialog_count += 1
+            for key, predicate in wanted.items():
+                if key not in found and predicate(dialog.entity):
+                    found[key] = dialog.entity
+            if len(found) == len(wanted):
+                break
+        return found, dialog_count
+
+    async def resolve(self, target_user, log_chat_id):
+        """Resolve (target user entity, log chat entity); either may be None"""
+        started = time.perf_counter()
+        self.timings = {}
+        self.sources = {}
+        wanted = {self.key('user', target_user): lambda e: self.matches_user(e, target_user)}
+        queries = {self.key('user', target_user): target_user}
+        if log_chat_id != 'me':
+            wanted[self.key('chat', log_chat_id)] = lambda e: self.matches_chat(e, log_chat_id)
+            queries[self.key('chat', log_chat_id)] = log_chat_id
+
+        resolved = {}
+        for key, query in queries.items():
+            entity = await self._timed('cache', self._from_cache(key, query))
+            if entity is not None:
+                resolved[key] = entity
+                self.sources[key] = 'cache'
+
+        for key, query in queries.items():
+            if key in resolved:
+                continue
+            entity = await self._timed('direct', self._direct(query))
+            if entity is not None and wanted[key](entity):
+                resolved[key] = entity
+                self.sources[key] = 'lookup'
+
+        missing = {key: predicate for key, predicate in wanted.items() if key not in resolved}
+        if missing:
+            found, dialog_count = await self._timed('scan', self._scan(missing))
+            for key, entity in found.items():
+                resolved[key] = entity
+                self.sources[key] = f"scan of {dialog_count} dialogs"
+            if len(found) < len(missing):
+                print(f"   Scanned {dialog_count} dialogs total")
+
+        for key, entity in resolved.items():
+            source = self.sources[key]
+            if source == 'cache':
+                continue
+            self._remember(key, entity, 'lookup' if source == 'lookup' else 'scan')
+        self._save()
+
+        self.timings['total'] = time.perf_counter() - started
+        target = resolved.get(self.key('user', target_user))
+        log_chat = resolved.get(self.key('chat', log_chat_id))
+        return target, log_chat
+
+    def report(self):
+        """One-line summary of where entities came from and how long it took"""
+        phases = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.timings.items())
+        sources = ', '.join(f"{key} from {source}" for key, source in self.sources.items())
+        return f"{sources or 'nothing resolved'} ({phases})"
@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+from telethon.errors import FloodWaitError
+
+
+class TokenBucket:
+    """Token bucket rate limiter: `rate` tokens per second, up to `capacity` saved up"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class LogQueue:
+    """Bounded outbound queue drained by a single sender task
+
+    Jobs are zero-argument callables returning an awaitable (for example
+    `lambda: client.send_message(chat, text)`). The sender paces them with a
+    token bucket, sleeps through FloodWaitError and retries other failures
+    with exponential backoff. When the queue is full, `put` waits up to
+    `put_timeout` seconds for room before dropping the job. Jobs still
+    queued (or being sent) when `close` gives up are left in `unfinished`.
+    """
+
+    def __init__(self, maxsize=1000, rate=1.0, burst=5, max_retries=5,
+                 backoff=1.0, put_timeout=5.0):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.put_timeout = put_timeout
+        self.sender_task = None
+        self.current = None  # Job being sent
+        self.unfinished = []
+
+        # Counters
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.flood_waits = 0
+
+    @property
+    def depth(self):
+        """Number of jobs waiting to be sent"""
+        return self.queue.qsize()
+
+    def start(self, supervisor):
+        """Start the sender task (restarted by the supervisor if it crashes)"""
+        if self.sender_task is None:
+            self.sender_task = supervisor.spawn('log sender', self._sender)
+
+    async def put(self, job, block=False):
+        """Queue a send job, waiting for room if the queue is full
+
+        With `block`, wait as long as it takes instead of dropping the job
+        (used for work resumed from the last run).
+        """
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if block:
+            await self.queue.put(job)
+            return True
+
+        try:
+            await asyncio.wait_for(self.queue.put(job), timeout=self.put_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            print(f"Log queue full, dropped message ({self.dropped} dropped so far)")
+            return False
+
+    async def _send(self, job):
+        """Send one job, retrying until it succeeds or runs out of attempts"""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await job()
+                self.sent += 1
+                return
+            except FloodWaitError as e:
+                # Telegram tells us exactly how long to back off; this is not a failed attempt
+                self.flood_waits += 1
+                print(f"Flood wait: sleeping {e.seconds}s before sending more logs")
+                await asyncio.sleep(e.seconds)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    print(f"Error sending log: {e}")
+                    return
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def _sender(self):
+        while True:
+            job = await self.queue.get()
+            self.current = job
+            try:
+                await self._send(job)
+            finally:
+                self.queue.task_done()
+            # Not reached when cancelled, so close() still sees the interrupted job
+            self.current = None
+
+    async def close(self, timeout=10.0):
+        """Give queued jobs up to `timeout` seconds to go out, then stop the sender"""
+        if self.sender_task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️  {self.depth} log message(s) were not sent before shutdown")
+        self.sender_task.cancel()
+        try:
+            await self.sender_task
+        except asyncio.CancelledError:
+            pass
+        self.sender_task = None
+        # Interrupted mid-send: it may or may not have gone out, so it is kept
+        if self.current is not None:
+            self.unfinished.append(self.current)
+            self.current = None
+        while not self.queue.empty():
+            self.unfinished.append(self.queue.get_nowait())
+
+    def stats(self):
+        """Snapshot of queue depth and counters"""
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+        }
@@ -0,0 +1,84 @@
+import hashlib
+from collections import OrderedDict
+
+
+def media_key(message):
+    """Stable id of the photo/document in a message, or None"""
+    if message.photo:
+        return ('photo', message.photo.id)
+    if message.document:
+        return ('document', message.document.id)
+    return None
+
+
+def content_hash(data):
+    """SHA-256 of in-memory media"""
+    return ('sha256', hashlib.sha256(data).hexdigest())
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a media file on disk (blocking, run it off the event loop)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return ('sha256', digest.hexdigest())
+
+
+class MediaDedupCache:
+    """LRU map from media ids / content hashes to media already in the log chat
+
+    Values are the `media` of messages we sent to the log chat, which can be
+    sent again by reference without transferring the file.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+        # Counters
+        self.lookups = 0
+        self.hits = 0
+        self.reference_sends = 0
+        self.fallbacks = 0
+        self.bytes_saved = 0
+
+    def get(self, key):
+        """Return the log chat media for a key, or None"""
+        if key is None:
+            return None
+        self.lookups += 1
+        media = self.entries.get(key)
+        if media is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return media
+
+    def put(self, key, media):
+        """Remember the log chat media for a key"""
+        if key is None or media is None:
+            return
+        self.entries[key] = media
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        """Forget a key whose media could not be reused"""
+        self.entries.pop(key, None)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        """Snapshot of cache size, hit rate and transfer savings"""
+        return {
+            'entries': len(self.entries),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hit_rate, 3),
+            'reference_sends': self.reference_sends,
+            'fallbacks': self.fallbacks,
+            'bytes_saved': self.bytes_saved,
+        }
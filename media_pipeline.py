@@ -0,0 +1,420 @@
+import asyncio
+import io
+import os
+import time
+from functools import partial
+
+from telethon.errors import FloodWaitError
+
+from media_dedup import content_hash, file_hash, media_key
+
+
+class MediaJob:
+    """A media message waiting to be copied to the log chat"""
+    __slots__ = ('message', 'media_type', 'caption', 'log_header', 'album', 'enqueued')
+
+    def __init__(self, message, media_type, caption, log_header, album=None):
+        self.message = message
+        self.media_type = media_type
+        self.caption = caption
+        self.log_header = log_header
+        self.album = album  # One MediaJob per message when this job is a whole album
+        self.enqueued = time.monotonic()
+
+    def dump(self):
+        """JSON-safe form for saving unfinished work; the message is fetched again on resume"""
+        return {
+            'chat_id': self.message.chat_id,
+            'message_id': self.message.id,
+            'media_type': self.media_type,
+            'caption': self.caption,
+            'log_header': self.log_header,
+            'album': [item.dump() for item in self.album] if self.album else None,
+        }
+
+
+class MediaPipeline:
+    """Pool of workers that download media and re-upload it to the log chat
+
+    Media is first sent by reference (the original file, or with a dedup
+    cache a copy already in the log chat) and only downloaded when that
+    fails. Files up to `memory_threshold` bytes are streamed through memory
+    and never touch disk; larger (or unknown-size) files are spooled into
+    the media store. Handlers only enqueue jobs, so a large video no
+    longer holds up the messages behind it. With `upload` off, every file
+    is downloaded into the media store and nothing is sent to the log chat.
+    Jobs still queued or in progress when `close` gives up are left in
+    `unfinished`.
+    """
+
+    def __init__(self, client, log_chat_id, send_log, media_store, workers=3,
+                 memory_threshold=10 * 1024 * 1024, queue_size=100, dedup=None, metrics=None,
+                 upload=True, record_media=None):
+        self.client = client
+        self.media_store = media_store
+        self.dedup = dedup
+        self.metrics = metrics
+        self.upload = upload  # False: only download to disk, nothing is sent to the log chat
+        self.record_media = record_media  # Async callback(job, media_path, source) after each file
+        self.log_chat_id = log_chat_id
+        self.send_log = send_log
+        self.worker_count = workers
+        self.memory_threshold = memory_threshold
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = []
+        self.active = {}  # Worker number -> job in progress
+        self.unfinished = []
+
+        # Counters
+        self.completed = 0
+        self.failed = 0
+        self.bytes_in_memory = 0
+        self.bytes_spooled = 0
+        self.download_seconds = 0.0
+        self.upload_seconds = 0.0
+
+    @property
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        return self.queue.qsize()
+
+    def start(self, supervisor):
+        """Start the worker tasks (restarted by the supervisor if they crash)"""
+        if self.workers:
+            return
+        for number in range(1, self.worker_count + 1):
+            self.workers.append(supervisor.spawn(f'media worker {number}', partial(self._worker, number)))
+
+    async def submit(self, job):
+        """Queue a media job, waiting if the queue is full"""
+        await self.queue.put(job)
+
+    async def _worker(self, number):
+        # A job left behind by a crash of this worker's last run is not retried
+        self.active.pop(number, None)
+        while True:
+            job = await self.queue.get()
+            self.active[number] = job
+            try:
+                if job.album:
+                    await self._process_album(job, number)
+                else:
+                    await self._process(job, number)
+            except Exception as e:
+                self.failed += 1
+                await self.send_log(job.log_header + f"❌ Error downloading media: {str(e)}",
+                                    kind='media_error', message_id=job.message.id, error=str(e))
+                print(f"Error downloading media: {e}")
+            finally:
+                self.queue.task_done()
+            # Not reached when cancelled, so close() still sees the interrupted job
+            del self.active[number]
+
+    def _progress(self, label, number):
+        """Build a progress callback that prints every 25%"""
+        reported = [0]
+
+        def callback(current, total):
+            if not total:
+                return
+            percent = current * 100 // total
+            if percent >= reported[0] + 25:
+                reported[0] = percent - percent % 25
+                print(f"   [media worker {number}] {label} {reported[0]}% ({current}/{total} bytes)")
+        return callback
+
+    async def _send(self, file, caption, progress_callback=None):
+        """Send a file or media reference to the log chat, sleeping through flood waits"""
+        while True:
+            try:
+                return await self.client.send_file(
+                    self.log_chat_id,
+                    file,
+                    caption=caption,
+                    progress_callback=progress_callback
+                )
+            except FloodWaitError as e:
+                print(f"Flood wait: sleeping {e.seconds}s before uploading media")
+                await asyncio.sleep(e.seconds)
+                for item in file if isinstance(file, list) else [file]:
+                    if isinstance(item, io.BytesIO):
+                        item.seek(0)
+
+    async def _send_reference(self, media, caption):
+        """Send media that is already on Telegram's servers, or None if it can't be reused"""
+        try:
+            return await self._send(media, caption)
+        except Exception:
+            # Protected chats, expired file references, self-destructing media...
+            return None
+
+    async def _process(self, job, number):
+        message = job.message
+        size = message.file.size if message.file else None
+        started = time.monotonic()
+        waited = started - job.enqueued
+        key = media_key(message)
+
+        if not self.upload:
+            # Already downloaded for an earlier message
+            path = await self.media_store.lookup(key)
+            if path:
+                self.completed += 1
+                print(f"✓ Already stored: {job.media_type} at {path}")
+                await self._record(job, path, 'media store')
+                return
+            path = await self._download_to_store(job, number)
+            if not path:
+                self.failed += 1
+                await self.send_log(job.log_header + "❌ Failed to download media",
+                                    kind='media_error', message_id=message.id, error='download failed')
+                return
+            path = await self.media_store.put_file(path, key)
+            self.completed += 1
+            self.bytes_spooled += size or 0
+            self.download_seconds += time.monotonic() - started
+            print(f"✓ Downloaded: {job.media_type} to {path}")
+            await self._record(job, path, 'download')
+            return
+
+        if self.dedup:
+            # The same file was already copied to the log chat
+            cached = self.dedup.get(key)
+            if cached is not None:
+                if await self._send_reference(cached, job.caption):
+                    await self._reused(job, size, 2 * (size or 0), 'dedup cache')
+                    return
+                self.dedup.discard(key)
+
+        # Forward-free copy using the original file reference
+        sent = await self._send_reference(message.media, job.caption)
+        if sent:
+            if self.dedup:
+                self.dedup.reference_sends += 1
+                self.dedup.put(key, sent.media)
+            await self._reused(job, size, 2 * (size or 0), 'file reference')
+            return
+        if self.dedup:
+            self.dedup.fallbacks += 1
+
+        fetched = await self._fetch(job, number)
+        if fetched is None:
+            self.failed += 1
+            await self.send_log(job.log_header + "❌ Failed to download media",
+                                kind='media_error', message_id=job.message.id, error='download failed')
+            return
+        file, size, source, digest, download_time = fetched
+
+        if self.dedup:
+            # Same content under a different id (re-sent files, re-encoded stickers...)
+            cached = self.dedup.get(digest)
+            if cached is not None:
+                if await self._send_reference(cached, job.caption):
+                    self.dedup.put(key, cached)
+                    await self._reused(job, size, size or 0, 'content hash')
+                    return
+                self.dedup.discard(digest)
+
+        # Upload
+        started = time.monotonic()
+        sent = await self._send(
+            file,
+            job.caption,
+            progress_callback=None if source == 'memory' else self._progress('uploading', number)
+        )
+        upload_time = time.monotonic() - started
+
+        if self.dedup and sent:
+            self.dedup.put(key, sent.media)
+            self.dedup.put(digest, sent.media)
+
+        self.completed += 1
+        self._uploaded(upload_time)
+        await self._record(job, None if source == 'memory' else file, 'upload')
+        print(f"✓ Downloaded and sent: {job.media_type} "
+              f"({size or 'unknown'} bytes via {source}, "
+              f"queued {waited:.1f}s, download {download_time:.1f}s, upload {upload_time:.1f}s)")
+
+    async def _process_album(self, job, number):
+        """Copy an album (job.album holds one job per message) to the log chat as one album"""
+        jobs = job.album
+        started = time.monotonic()
+        waited = started - job.enqueued
+
+        if not self.upload:
+            # One failed item must not hide the others' results
+            results = await asyncio.gather(*(self._process(item, number) for item in jobs), return_exceptions=True)
+            for item, result in zip(jobs, results):
+                if isinstance(result, BaseException):
+                    self.failed += 1
+                    await self.send_log(job.log_header + f"❌ Error downloading album item: {result}",
+                                        kind='media_error', message_id=item.message.id, error=str(result))
+            return
+
+        # The whole album by reference in one call
+        sent = await self._send_reference([item.message.media for item in jobs], job.caption)
+        if sent:
+            if not isinstance(sent, list):
+                sent = [sent]
+            if self.dedup:
+                self.dedup.reference_sends += len(jobs)
+            for item, message in zip(jobs, sent):
+                if self.dedup:
+                    self.dedup.put(media_key(item.message), message.media)
+                size = item.message.file.size if item.message.file else None
+                await self._reused(item, size, 2 * (size or 0), 'file reference')
+            return
+        if self.dedup:
+            self.dedup.fallbacks += len(jobs)
+
+        # Download every item at once
+        results = await asyncio.gather(*(self._fetch(item, number) for item in jobs), return_exceptions=True)
+        fetched = []
+        for item, result in zip(jobs, results):
+            if isinstance(result, BaseException) or result is None:
+                self.failed += 1
+                error = str(result) if result is not None else 'download failed'
+                await self.send_log(job.log_header + f"❌ Error downloading album item: {error}",
+                                    kind='media_error', message_id=item.message.id, error=error)
+            else:
+                fetched.append((item, result))
+        if not fetched:
+            return
+        download_time = time.monotonic() - started
+
+        # One upload round for the whole album
+        started = time.monotonic()
+        sent = await self._send([result[0] for _, result in fetched], job.caption)
+        upload_time = time.monotonic() - started
+        if not isinstance(sent, list):
+            sent = [sent]
+
+        for (item, (file, size, source, digest, _)), message in zip(fetched, sent):
+            if self.dedup and message:
+                self.dedup.put(media_key(item.message), message.media)
+                self.dedup.put(digest, message.media)
+            self.completed += 1
+            await self._record(item, None if source == 'memory' else file, 'upload')
+        self._uploaded(upload_time)
+        print(f"✓ Downloaded and sent album: {len(fetched)} of {len(jobs)} items "
+              f"(queued {waited:.1f}s, download {download_time:.1f}s, upload {upload_time:.1f}s)")
+
+    async def _fetch(self, job, number):
+        """Get a job's file ready for upload
+
+        Returns (file, size, source, digest, seconds) or None if the
+        download failed. `source` is 'memory' (a BytesIO), 'disk' (just
+        downloaded into the media store) or 'media store' (already there).
+        `digest` is only computed when the dedup cache needs it.
+        """
+        message = job.message
+        key = media_key(message)
+        size = message.file.size if message.file else None
+
+        # An earlier copy is still in the media store
+        stored = await self.media_store.lookup(key)
+        if stored:
+            # Stored files are named by their hash
+            digest = ('sha256', os.path.splitext(os.path.basename(stored))[0])
+            return stored, size, 'media store', digest, 0.0
+
+        started = time.monotonic()
+        digest = None
+        if size is not None and size <= self.memory_threshold:
+            data = await message.download_media(file=bytes)
+            if not data:
+                return None
+            file = io.BytesIO(data)
+            # Telethon uses the name to pick the upload's file type
+            file.name = (message.file.name or f"media{message.file.ext or ''}")
+            size = len(data)
+            self.bytes_in_memory += size
+            if self.dedup:
+                digest = await asyncio.to_thread(content_hash, data)
+            source = 'memory'
+        else:
+            path = await self._download_to_store(job, number)
+            if not path:
+                return None
+            if self.dedup:
+                digest = await asyncio.to_thread(file_hash, path)
+            # Keep the file under its content hash; uploads read it from there
+            file = await self.media_store.put_file(path, key, digest)
+            self.bytes_spooled += size or 0
+            source = 'disk'
+
+        download_time = time.monotonic() - started
+        self.download_seconds += download_time
+        if self.metrics:
+            self.metrics.observe('tracker_media_transfer_seconds', download_time, direction='download')
+        return file, size, source, digest, download_time
+
+    def _uploaded(self, upload_time):
+        self.upload_seconds += upload_time
+        if self.metrics:
+            self.metrics.observe('tracker_media_transfer_seconds', upload_time, direction='upload')
+
+    async def _download_to_store(self, job, number):
+        """Download to a scratch file in the media store; returns its path or None"""
+        message = job.message
+        temp_path = self.media_store.temp_path(message.file.ext if message.file else '')
+        try:
+            path = await message.download_media(
+                file=temp_path,
+                progress_callback=self._progress('downloading', number)
+            )
+        except BaseException:
+            await self.media_store.discard(temp_path)
+            raise
+        if not path:
+            await self.media_store.discard(temp_path)
+        return path
+
+    async def _record(self, job, path, source):
+        if self.record_media:
+            await self.record_media(job, path, source)
+
+    async def _reused(self, job, size, saved, source):
+        """Account for media sent without uploading it again"""
+        await self._record(job, None, source)
+        self.completed += 1
+        if not self.dedup:
+            print(f"✓ Sent without re-uploading: {job.media_type} ({size or 'unknown'} bytes, via {source})")
+            return
+        self.dedup.bytes_saved += saved
+        print(f"✓ Sent without re-uploading: {job.media_type} "
+              f"({size or 'unknown'} bytes, via {source}; "
+              f"{self.dedup.bytes_saved} bytes saved, {self.dedup.hit_rate:.0%} cache hit rate)")
+
+    async def close(self, timeout=30.0):
+        """Give queued jobs up to `timeout` seconds to finish, then stop the workers"""
+        if not self.workers:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️  {self.depth} media job(s) were not finished before shutdown")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # Interrupted jobs start over next time
+        self.unfinished.extend(self.active.values())
+        self.active.clear()
+        while not self.queue.empty():
+            self.unfinished.append(self.queue.get_nowait())
+
+    def stats(self):
+        """Snapshot of queue depth, counters and transfer times"""
+        stats = {
+            'depth': self.depth,
+            'completed': self.completed,
+            'failed': self.failed,
+            'bytes_in_memory': self.bytes_in_memory,
+            'bytes_spooled': self.bytes_spooled,
+            'download_seconds': round(self.download_seconds, 3),
+            'upload_seconds': round(self.upload_seconds, 3),
+        }
+        if self.dedup:
+            stats['dedup'] = self.dedup.stats()
+        return stats
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from media_dedup import file_hash
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    digest TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    added REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_accessed ON files (accessed);
+CREATE TABLE IF NOT EXISTS media_keys (
+    kind TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (kind, media_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_media_keys_digest ON media_keys (digest);
+"""
+
+
+class MediaStore:
+    """Content-addressed, quota-managed media files under one directory
+
+    Files are named by SHA-256 and sharded as `ab/cd/abcd....ext`, so
+    identical media is stored once and names never collide. Downloads land
+    in `.tmp/` and are moved into place with os.replace(), so a file under
+    its final name is always complete. A small SQLite index records size
+    and last access per file, plus which Telegram photo/document ids map
+    to which file. The least recently used files are evicted once the
+    store exceeds `max_bytes`, and files unused for `max_age` seconds are
+    removed too. All disk and index work runs on a dedicated thread.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024, max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.temp_dir = os.path.join(directory, '.tmp')
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='media-store')
+        self.connection = None
+        self.total_bytes = 0
+
+        # Counters
+        self.files = 0
+        self.stored = 0
+        self.duplicates = 0
+        self.hits = 0
+        self.evictions = 0
+        self.bytes_evicted = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def start(self):
+        """Open the index, clear interrupted downloads and apply the quota"""
+        await self._run(self._open)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Leftovers from downloads interrupted by a crash
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.directory, 'index.db'), check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(INDEX_SCHEMA)
+        self.connection = connection
+        self.files, self.total_bytes = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files"
+        ).fetchone()
+        with connection:
+            self._evict()
+
+    def temp_path(self, ext=''):
+        """Unique path in the store's scratch directory to download into"""
+        return os.path.join(self.temp_dir, uuid.uuid4().hex + (ext or ''))
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest + ext)
+
+    async def lookup(self, key):
+        """Stored path for a Telegram media key (see media_dedup.media_key), or None"""
+        if key is None or self.connection is None:
+            return None
+        return await self._run(self._lookup, key)
+
+    def _lookup(self, key):
+        row = self.connection.execute(
+            "SELECT f.digest, f.ext FROM media_keys k JOIN files f ON f.digest = k.digest "
+            "WHERE k.kind = ? AND k.media_id = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        path = self.path_for(*row)
+        with self.connection:
+            if not os.path.exists(path):
+                # Removed by hand; forget it
+                self._forget(row[0])
+                return None
+            self.connection.execute("UPDATE files SET accessed = ? WHERE digest = ?", (time.time(), row[0]))
+        self.hits += 1
+        return path
+
+    async def put_file(self, source, key=None, digest=None):
+        """Move a finished download into the store and return its final path
+
+        `digest` is the ('sha256', hex) pair from media_dedup.file_hash()
+        when the caller already computed it.
+        """
+        return await self._run(self._put, source, key, digest)
+
+    def _put(self, source, key, digest):
+        if digest is None:
+            digest = file_hash(source)
+        digest = digest[1]
+        ext = os.path.splitext(source)[1].lower()
+        now = time.time()
+        row = self.connection.execute("SELECT ext FROM files WHERE digest = ?", (digest,)).fetchone()
+        with self.connection:
+            if row is not None and os.path.exists(self.path_for(digest, row[0])):
+                # Already stored (same content under another id)
+                os.remove(source)
+                self.duplicates += 1
+                ext = row[0]
+                self.connection.execute("UPDATE files SET accessed = ? WHERE digest = ?", (now, digest))
+            else:
+                if row is not None:
+                    self._forget(digest)
+                path = self.path_for(digest, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(source, path)
+                size = os.path.getsize(path)
+                self.connection.execute(
+                    "INSERT INTO files (digest, ext, size, added, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (digest, ext, size, now, now)
+                )
+                self.files += 1
+                self.stored += 1
+                self.total_bytes += size
+            if key is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO media_keys (kind, media_id, digest) VALUES (?, ?, ?)",
+                    (key[0], key[1], digest)
+                )
+            self._evict(keep=digest)
+        return self.path_for(digest, ext)
+
+    async def discard(self, path):
+        """Delete a scratch file that will not be stored (failed or abandoned download)"""
+        if path and os.path.dirname(path) == self.temp_dir:
+            await self._run(self._unlink, path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, digest):
+        """Remove a file and its index rows (caller commits)"""
+        row = self.connection.execute("SELECT ext, size FROM files WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return
+        self._unlink(self.path_for(digest, row[0]))
+        self.connection.execute("DELETE FROM files WHERE digest = ?", (digest,))
+        self.connection.execute("DELETE FROM media_keys WHERE digest = ?", (digest,))
+        self.files -= 1
+        self.total_bytes -= row[1]
+
+    def _evict(self, keep=None):
+        """Drop files past max_age, then least recently used files until under quota (caller commits)"""
+        victims = []
+        if self.max_age:
+            victims = self.connection.execute(
+                "SELECT digest, size FROM files WHERE accessed < ?", (time.time() - self.max_age,)
+            ).fetchall()
+        excess = self.total_bytes - sum(size for _, size in victims) - (self.max_bytes or float('inf'))
+        if excess > 0:
+            chosen = {digest for digest, _ in victims}
+            for digest, size in self.connection.execute("SELECT digest, size FROM files ORDER BY accessed"):
+                if excess <= 0:
+                    break
+                if digest in chosen or digest == keep:
+                    continue
+                victims.append((digest, size))
+                excess -= size
+        for digest, size in victims:
+            if digest == keep:
+                continue
+            self._forget(digest)
+            self.evictions += 1
+            self.bytes_evicted += size
+
+    async def close(self):
+        if self.connection is None:
+            return
+        await self._run(self.connection.close)
+        self.connection = None
+        self.executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'files': self.files,
+            'bytes': self.total_bytes,
+            'stored': self.stored,
+            'duplicates': self.duplicates,
+            'hits': self.hits,
+            'evictions': self.evictions,
+            'bytes_evicted': self.bytes_evicted,
+        }
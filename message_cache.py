@@ -0,0 +1,169 @@
+import sys
+import time
+from collections import OrderedDict
+
+# Marked channel/supergroup ids are at or below this value; message ids are
+# only unique per channel there, while private chats and basic groups share
+# one per-account sequence.
+CHANNEL_ID_BOUNDARY = -1000000000000
+
+
+def cache_key(chat_id, message_id):
+    """Cache key of a message: (channel id or None, message id)
+
+    Deletions in private chats and basic groups come without a chat id,
+    so those messages are keyed by message id alone; channel messages are
+    keyed by their channel too.
+    """
+    if chat_id is not None and chat_id <= CHANNEL_ID_BOUNDARY:
+        return (chat_id, message_id)
+    return (None, message_id)
+
+
+class CachedMessage:
+    """Compact record of a tracked message, used for edit/delete detection"""
+    __slots__ = ('chat_id', 'sender_id', 'text', 'media', 'media_type', 'time', 'history', 'touched', 'size')
+
+    def __init__(self, sender_id, text, media, media_type, time, chat_id=None, history=None):
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.text = text
+        self.media = media
+        self.media_type = media_type
+        self.time = time
+        self.history = history  # EditHistory once the message has been edited
+        self.touched = 0.0
+        self.size = 0
+        self.measure()
+
+    def measure(self):
+        """Recompute the approximate memory footprint of this record"""
+        size = sys.getsizeof(self)
+        if self.text:
+            size += sys.getsizeof(self.text)
+        if self.time:
+            size += sys.getsizeof(self.time)
+        if self.history is not None:
+            size += self.history.size()
+        self.size = size
+        return size
+
+
+class MessageCache:
+    """LRU cache of tracked messages bounded by entry count, total bytes and idle TTL
+
+    Keyed by cache_key(chat_id, message_id).
+
+    Entries are kept in access order, so the least recently used entry is
+    always at the front and eviction is O(1). An entry that has not been
+    touched for `ttl` seconds is treated as expired.
+    """
+
+    def __init__(self, max_entries=50000, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        record = self.entries.get(key)
+        return record is not None and not self._expired(record, time.monotonic())
+
+    def _expired(self, record, now):
+        return self.ttl is not None and now - record.touched > self.ttl
+
+    def _remove(self, key):
+        record = self.entries.pop(key)
+        self.total_bytes -= record.size
+        return record
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until within limits"""
+        now = time.monotonic()
+        while self.entries:
+            key, record = next(iter(self.entries.items()))
+            if self._expired(record, now):
+                self._remove(key)
+                self.expirations += 1
+            elif len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(key)
+                self.evictions += 1
+            else:
+                break
+
+    def _live(self, key, now):
+        """The record for a message unless it has expired (then it is dropped); leaves hits/misses alone"""
+        record = self.entries.get(key)
+        if record is not None and self._expired(record, now):
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return record
+
+    def get(self, key):
+        """Return the cached record for a message, or None"""
+        now = time.monotonic()
+        record = self._live(key, now)
+        if record is None:
+            self.misses += 1
+            return None
+
+        record.touched = now
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return record
+
+    def put(self, key, record):
+        """Insert or replace a record and evict anything over the limits"""
+        if key in self.entries:
+            self._remove(key)
+
+        record.touched = time.monotonic()
+        self.entries[key] = record
+        self.total_bytes += record.size
+        self._evict()
+
+    def update_text(self, key, text, history=None):
+        """Replace the text (and edit history) of a cached record, keeping the byte total accurate"""
+        now = time.monotonic()
+        record = self._live(key, now)
+        if record is None:
+            return None
+
+        record.touched = now
+        self.entries.move_to_end(key)
+        self.total_bytes -= record.size
+        record.text = text
+        if history is not None:
+            record.history = history
+        self.total_bytes += record.measure()
+        self._evict()
+        return record
+
+    def pop(self, key):
+        """Remove and return the record for a message, or None"""
+        record = self._live(key, time.monotonic())
+        if record is not None:
+            self._remove(key)
+        return record
+
+    def stats(self):
+        """Snapshot of cache size and counters"""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,342 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from edit_history import EditHistory
+from message_cache import CHANNEL_ID_BOUNDARY, CachedMessage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender_id INTEGER,
+    text TEXT,
+    media INTEGER NOT NULL DEFAULT 0,
+    media_type TEXT,
+    time TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    original_text TEXT,
+    edits TEXT,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages (message_id);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chat_id INTEGER PRIMARY KEY,
+    message_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Full-text index over tracked messages. search_index holds one row per
+# message (text or caption, media type, status words such as "edited
+# deleted"); messages_fts is an FTS5 index over it kept in sync by triggers,
+# so the store only ever writes search_index.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_index (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    time TEXT,
+    text TEXT,
+    media_type TEXT,
+    status TEXT NOT NULL DEFAULT '',
+    UNIQUE (chat_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_search_index_time ON search_index (time);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, media_type, status,
+    content='search_index', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS search_index_insert AFTER INSERT ON search_index BEGIN
+    INSERT INTO messages_fts (rowid, text, media_type, status)
+    VALUES (new.id, new.text, new.media_type, new.status);
+END;
+CREATE TRIGGER IF NOT EXISTS search_index_delete AFTER DELETE ON search_index BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, media_type, status)
+    VALUES ('delete', old.id, old.text, old.media_type, old.status);
+END;
+CREATE TRIGGER IF NOT EXISTS search_index_update AFTER UPDATE ON search_index BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, media_type, status)
+    VALUES ('delete', old.id, old.text, old.media_type, old.status);
+    INSERT INTO messages_fts (rowid, text, media_type, status)
+    VALUES (new.id, new.text, new.media_type, new.status);
+END;
+"""
+
+# Columns added after the first release, created on older databases at startup
+MIGRATIONS = {
+    'original_text': "ALTER TABLE messages ADD COLUMN original_text TEXT",
+    'edits': "ALTER TABLE messages ADD COLUMN edits TEXT",
+}
+
+
+class MessageStore:
+    """Durable SQLite (WAL) copy of tracked messages
+
+    Handlers only queue writes; a background writer task flushes them in
+    batches on a dedicated database thread so the event loop never waits on
+    disk. Rows are read back one at a time on cache misses, so nothing is
+    loaded into memory up front.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, search_index=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.search_index = search_index
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='message-store')
+        self.pending = []  # Queued (sql, params) writes
+        self.pending_rows = {}  # (chat_id, message_id) -> CachedMessage not yet on disk
+        self.wakeup = asyncio.Event()
+        self.writer_task = None
+        self.closing = False
+
+        # Counters
+        self.writes = 0
+        self.flushes = 0
+        self.reads = 0
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+        for column, sql in MIGRATIONS.items():
+            if column not in columns:
+                connection.execute(sql)
+        if self.search_index:
+            self._open_search_index(connection)
+        connection.commit()
+        self.connection = connection
+
+    def _open_search_index(self, connection):
+        """Create the full-text index, filling it from existing rows the first time"""
+        existed = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        ).fetchone()
+        try:
+            connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️  Full-text search disabled (SQLite without FTS5?): {e}")
+            self.search_index = False
+            return
+        if not existed:
+            connection.execute(
+                "INSERT INTO search_index (chat_id, message_id, time, text, media_type, status) "
+                "SELECT chat_id, message_id, time, text, media_type, "
+                "TRIM(CASE WHEN edits IS NOT NULL THEN 'edited' ELSE '' END || "
+                "CASE WHEN deleted THEN ' deleted' ELSE '' END) FROM messages"
+            )
+
+    async def _run(self, func, *args):
+        """Run a database call on the store's thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def start(self, supervisor):
+        """Open the database and start the background writer (restarted by the supervisor if it crashes)"""
+        await self._run(self._open)
+        self.writer_task = supervisor.spawn('message store writer', self._writer)
+
+    async def close(self):
+        """Flush pending writes and close the database"""
+        if self.connection is None:
+            return
+        if self.writer_task:
+            # Let the writer finish its current flush and exit rather than
+            # cancelling it mid-wait, which can leave close() hanging
+            self.closing = True
+            self.wakeup.set()
+            await self.writer_task
+            self.writer_task = None
+        await self.flush()
+        await self._run(self.connection.close)
+        self.connection = None
+        self.executor.shutdown(wait=True)
+
+    def _queue(self, sql, params):
+        self.pending.append((sql, params))
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    def save(self, message_id, record):
+        """Queue an insert/replace of a tracked message"""
+        chat_id = record.chat_id
+        history = record.history
+        self.pending_rows[(chat_id, message_id)] = record
+        self._queue(
+            "INSERT OR REPLACE INTO messages "
+            "(chat_id, message_id, sender_id, text, media, media_type, time, deleted, original_text, edits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+            (chat_id, message_id, record.sender_id, record.text,
+             int(record.media), record.media_type, record.time,
+             history.original if history else None, history.dumps() if history else None)
+        )
+        if self.search_index:
+            self._queue(
+                "INSERT INTO search_index (chat_id, message_id, time, text, media_type, status) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat_id, message_id) DO UPDATE SET "
+                "time = excluded.time, text = excluded.text, "
+                "media_type = excluded.media_type, status = excluded.status",
+                (chat_id, message_id, record.time, record.text, record.media_type,
+                 'edited' if history else '')
+            )
+
+    def update_text(self, chat_id, message_id, text, history=None):
+        """Queue a text update for an edited message, along with its edit history"""
+        record = self.pending_rows.get((chat_id, message_id))
+        if record is not None:
+            record.text = text
+            if history is not None:
+                record.history = history
+        if history is None:
+            self._queue(
+                "UPDATE messages SET text = ? WHERE chat_id = ? AND message_id = ?",
+                (text, chat_id, message_id)
+            )
+        else:
+            self._queue(
+                "UPDATE messages SET text = ?, original_text = ?, edits = ? WHERE chat_id = ? AND message_id = ?",
+                (text, history.original, history.dumps(), chat_id, message_id)
+            )
+        if self.search_index:
+            self._queue(
+                "UPDATE search_index SET text = ?, status = 'edited' WHERE chat_id = ? AND message_id = ?",
+                (text, chat_id, message_id)
+            )
+
+    def mark_deleted(self, chat_id, message_id):
+        """Queue a deleted flag for a message"""
+        self.pending_rows.pop((chat_id, message_id), None)
+        self._queue(
+            "UPDATE messages SET deleted = 1 WHERE chat_id = ? AND message_id = ?",
+            (chat_id, message_id)
+        )
+        if self.search_index:
+            self._queue(
+                "UPDATE search_index SET status = TRIM(status || ' deleted') "
+                "WHERE chat_id = ? AND message_id = ? AND status NOT LIKE '%deleted%'",
+                (chat_id, message_id)
+            )
+
+    def set_checkpoint(self, chat_id, message_id):
+        """Queue the last processed message id for a chat (never moves backwards)"""
+        self._queue(
+            "INSERT INTO checkpoints (chat_id, message_id, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET "
+            "message_id = MAX(message_id, excluded.message_id), updated_at = excluded.updated_at",
+            (chat_id, message_id, time.time())
+        )
+
+    async def get_checkpoint(self, chat_id):
+        """Last processed message id for a chat, or None"""
+        row = await self._run(self._fetchone,
+                              "SELECT message_id FROM checkpoints WHERE chat_id = ?", (chat_id,))
+        return row[0] if row else None
+
+    async def recent(self, chat_id, limit):
+        """(message_id, text) of the newest `limit` non-deleted messages in a chat, oldest first"""
+        await self.flush()
+        rows = await self._run(self._fetchall,
+                               "SELECT message_id, text FROM messages "
+                               "WHERE chat_id = ? AND deleted = 0 "
+                               "ORDER BY message_id DESC LIMIT ?", (chat_id, limit))
+        rows.reverse()
+        return rows
+
+    def _fetchone(self, sql, params):
+        return self.connection.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        return self.connection.execute(sql, params).fetchall()
+
+    async def flush(self):
+        """Write all queued operations in a single transaction"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        rows, self.pending_rows = self.pending_rows, {}
+        try:
+            await self._run(self._write_batch, batch)
+        except Exception as e:
+            # Keep the batch so the next flush retries it
+            self.pending = batch + self.pending
+            rows.update(self.pending_rows)
+            self.pending_rows = rows
+            print(f"Error writing message store: {e}")
+            return
+        self.writes += len(batch)
+        self.flushes += 1
+
+    def _write_batch(self, batch):
+        with self.connection:
+            for sql, params in batch:
+                self.connection.execute(sql, params)
+
+    async def _writer(self):
+        """Flush queued writes every flush_interval or once a batch fills up"""
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def get(self, message_id, chat_id=None):
+        """Look up a stored message that has not been deleted
+
+        Returns a CachedMessage or None. When chat_id is unknown
+        (deletions in private chats and basic groups) only non-channel rows
+        are considered, since those share one message id sequence.
+        """
+        for (row_chat_id, row_message_id), record in self.pending_rows.items():
+            if row_message_id == message_id and (
+                row_chat_id == chat_id
+                or (chat_id is None and row_chat_id > CHANNEL_ID_BOUNDARY)
+            ):
+                return record
+
+        self.reads += 1
+        row = await self._run(self._select, message_id, chat_id)
+        if row is None:
+            return None
+        return CachedMessage(
+            sender_id=row[1],
+            text=row[2],
+            media=bool(row[3]),
+            media_type=row[4],
+            time=row[5],
+            chat_id=row[0],
+            history=EditHistory.loads(row[6], row[7]) if row[7] is not None else None
+        )
+
+    def _select(self, message_id, chat_id):
+        columns = "chat_id, sender_id, text, media, media_type, time, original_text, edits"
+        if chat_id is None:
+            cursor = self.connection.execute(
+                f"SELECT {columns} FROM messages "
+                "WHERE message_id = ? AND chat_id > ? AND deleted = 0",
+                (message_id, CHANNEL_ID_BOUNDARY)
+            )
+        else:
+            cursor = self.connection.execute(
+                f"SELECT {columns} FROM messages "
+                "WHERE chat_id = ? AND message_id = ? AND deleted = 0",
+                (chat_id, message_id)
+            )
+        return cursor.fetchone()
+
+    def stats(self):
+        """Snapshot of store counters"""
+        return {
+            'pending': len(self.pending),
+            'writes': self.writes,
+            'flushes': self.flushes,
+            'reads': self.reads,
+        }
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from bisect import bisect_left
+from functools import partial
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """In-process metrics registry with Prometheus text exposition
+
+    Counters and histograms are updated inline by the code they measure.
+    Values that components already track (queue depth, cache size, send
+    counters) are registered as callbacks and only read at scrape time,
+    so they cost nothing per event.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}  # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+        self.callbacks = {}  # name -> (type, fn)
+        self.help = {}
+        self.started = time.time()
+        self.server = None
+        self.summary_task = None
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram"""
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def register(self, name, kind, fn, help_text=None):
+        """Expose a number read from `fn()` at scrape time; `kind` is 'counter' or 'gauge'"""
+        self.callbacks[name] = (kind, fn)
+        if help_text:
+            self.help[name] = help_text
+
+    async def track(self, name, coro, **labels):
+        """Await a coroutine, recording its duration and any exception"""
+        started = time.perf_counter()
+        try:
+            return await coro
+        except Exception:
+            self.inc(name + '_errors_total', **labels)
+            raise
+        finally:
+            self.observe(name + '_seconds', time.perf_counter() - started, **labels)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(self.counters.items()):
+            header(name, 'counter')
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            header(name, 'histogram')
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        for name, (kind, fn) in sorted(self.callbacks.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            header(name, kind)
+            lines.append(f"{name} {value}")
+
+        header('tracker_uptime_seconds', 'gauge')
+        lines.append(f"tracker_uptime_seconds {time.time() - self.started:.0f}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Short human-readable summary of counters and handler latencies"""
+        parts = []
+        for name, series in sorted(self.counters.items()):
+            for key, value in series.items():
+                label = ','.join(str(label_value) for _, label_value in key)
+                parts.append(f"{name.replace('tracker_', '')}{'{' + label + '}' if key else ''}={value}")
+        for name, series in sorted(self.histograms.items()):
+            short_name = name.replace('tracker_', '')
+            for key, histogram in series.items():
+                label = short_name + ('{' + ','.join(str(value) for _, value in key) + '}' if key else '')
+                p50 = histogram.quantile(0.5)
+                p99 = histogram.quantile(0.99)
+                parts.append(f"{label} p50<={p50 * 1000:.1f}ms p99<={p99 * 1000:.1f}ms (n={histogram.count})")
+        for name, (kind, fn) in sorted(self.callbacks.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            parts.append(f"{name.replace('tracker_', '')}={value}")
+        return '\n   '.join(parts)
+
+    async def _handle(self, reader, writer):
+        try:
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            body = self.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=9464):
+        """Serve the text exposition on http://host:port/ (any path)"""
+        self.server = await asyncio.start_server(self._handle, host, port)
+
+    async def _report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(f"📊 Metrics summary:\n   {self.summary()}")
+
+    def start_summary(self, interval, supervisor):
+        """Print a summary every `interval` seconds, on a task owned by the supervisor"""
+        if interval and self.summary_task is None:
+            self.summary_task = supervisor.spawn('metrics summary', partial(self._report, interval))
+
+    async def close(self):
+        if self.summary_task:
+            self.summary_task.cancel()
+            self.summary_task = None
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
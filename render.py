@@ -0,0 +1,115 @@
+from datetime import datetime
+from functools import lru_cache
+
+# Telegram's limits, in UTF-16 code units
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+SEPARATOR = "─" * 30 + "\n"
+
+# Every log and caption is put together from these, compiled once into
+# bound str.format methods; headers already include the separator line
+TEMPLATES = {kind: template.format for kind, template in {
+    'tracker_started': "🤖 **Tracker Started**\n📱 Monitoring: {name} (@{username})\n🕐 Started at: {time}",
+    'tracker_stopped': "🛑 **Tracker Stopped**\n🕐 {time}",
+    'action_started': "**{name}**\n{emoji} {action}\n🕐 {time}",
+    'action_ended': "**{name}**\n{emoji} stopped {action}\n⏱ Duration: {duration}s ({updates} updates)\n🕐 {time}",
+
+    'new_message': "📨 **New Message**\n🕐 {time}\n👤 From: {name}\n🆔 Message ID: {message_id}\n" + SEPARATOR,
+    'new_album': "🖼️ **New Album** ({count} items)\n🕐 {time}\n👤 From: {name}\n🆔 Message IDs: {message_ids}\n" + SEPARATOR,
+    'message_edited': "✏️ **Message EDITED**{label}\n🕐 {time}\n👤 From: {name}\n🆔 Message ID: {message_id}\n" + SEPARATOR,
+    'message_deleted': "🗑️ **Message DELETED**\n🕐 {time}\n👤 From: {name}\n🆔 Message ID: {message_id}\n"
+                       "📅 Original Time: {original_time}\n" + SEPARATOR,
+
+    'text': "💬 **Text:**\n{text}",
+    'media': "📎 **Media Type:** {media_type}\n",
+    'album_media': "📎 **Media:** {summary}\n",
+    'caption': "💬 **Caption:** {text}\n",
+    'downloading': "⏳ Downloading media...",
+    'changes': "🔀 **Changes:**\n{diff}",
+    'first_version': "\n\n📜 **First Version:**\n{text}",
+    'original_text': "❌ **Original Text:**\n{text}\n\n",
+    'original_empty': "❌ **Original:** (No text)\n\n",
+    'new_text': "✅ **New Text:**\n{text}",
+    'new_empty': "✅ **New:** (No text)",
+    'current_text': "✅ **Current Text:**\n{text}",
+    'deleted_text': "❌ **Deleted Text:**\n{text}",
+    'also_media': "\n\n📎 **Also had media:** {media_type}",
+    'deleted_media': "📎 **Deleted Media:** {media_type}",
+
+    # Captions on the copies sent to the log chat
+    'media_caption': "📎 {media_type}\n🕐 {time}\n👤 From: {name}",
+    'album_caption': "🖼️ Album: {summary}\n🕐 {time}\n👤 From: {name}",
+    'caption_text': "\n💬 Caption: {text}",
+}.items()}
+
+
+def render(kind, **fields):
+    """Fill in the template for `kind`"""
+    return TEMPLATES[kind](**fields)
+
+
+@lru_cache(maxsize=256)
+def _format_second(second):
+    return datetime.fromtimestamp(second).strftime(TIME_FORMAT)
+
+
+def format_time(ts):
+    """Local '%Y-%m-%d %H:%M:%S' for an epoch timestamp, formatted once per second"""
+    return _format_second(int(ts))
+
+
+def format_time_ms(ts):
+    """format_time() with milliseconds"""
+    return f"{_format_second(int(ts))}.{int(ts % 1 * 1000):03d}"
+
+
+def utf16_len(text):
+    """Length as Telegram counts it"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _fit(text, limit):
+    """Number of leading characters of `text` that fit in `limit` UTF-16 units"""
+    end = min(len(text), limit)
+    excess = utf16_len(text[:end]) - limit
+    while excess > 0:
+        # Characters are one or two units, so halve the excess (rounded up) until it fits
+        end -= (excess + 1) // 2
+        excess = utf16_len(text[:end]) - limit
+    return end
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Split text into chunks Telegram accepts, breaking at a line, then a space, where possible"""
+    # Every character is at most two units, so short texts need no measuring
+    if len(text) * 2 <= limit or utf16_len(text) <= limit:
+        return [text]
+    chunks = []
+    while utf16_len(text) > limit:
+        end = _fit(text, limit)
+        cut = text.rfind('\n', end // 2, end)
+        if cut <= 0:
+            cut = text.rfind(' ', end // 2, end)
+        if cut <= 0:
+            chunks.append(text[:end])
+            text = text[end:]
+        else:
+            # The line break or space itself is dropped
+            chunks.append(text[:cut])
+            text = text[cut + 1:]
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def fit_caption(text, limit=CAPTION_LIMIT):
+    """Shorten a media caption to Telegram's caption limit
+
+    Only used for captions whose full text is also in the log message sent
+    before the media, so nothing is lost.
+    """
+    if len(text) * 2 <= limit or utf16_len(text) <= limit:
+        return text
+    return text[:_fit(text, limit - 1)] + '…'
@@ -0,0 +1,176 @@
+"""Search tracked messages in the message store's full-text index
+
+Queries use SQLite FTS5 syntax (words, "exact phrases", prefix*, AND/OR/NOT)
+and are ranked by relevance unless --newest is given (most recently stored
+first).
+
+    python search.py invoice
+    python search.py "meet* OR call" --since 7d --status deleted
+    python search.py --media Photo --since "2025-10-01" --until "2025-10-03 18:00"
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_DB = os.getenv('MESSAGE_STORE_PATH', 'messages.db')
+
+RELATIVE_RE = re.compile(r'^(\d+)([smhdw])$')
+RELATIVE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+# Timestamps in the store are local '%Y-%m-%d %H:%M:%S' strings, so they compare as text
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(value, end=False):
+    """'7d'/'12h' (ago), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM[:SS]' as a store timestamp"""
+    match = RELATIVE_RE.match(value)
+    if match:
+        delta = timedelta(**{RELATIVE_UNITS[match.group(2)]: int(match.group(1))})
+        return (datetime.now() - delta).strftime(TIME_FORMAT)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt == '%Y-%m-%d' and end:
+            # A bare end date includes that whole day
+            parsed += timedelta(days=1, seconds=-1)
+        return parsed.strftime(TIME_FORMAT)
+    raise argparse.ArgumentTypeError(f"unrecognised time {value!r}")
+
+
+def quote_terms(query):
+    """Treat every word as a literal term, for queries that are not valid FTS5 syntax"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def build_match(query, statuses, media_type):
+    parts = []
+    if query:
+        # Only the message text; status and media type have their own filters
+        parts.append(f"text : ({query})")
+    for status in statuses:
+        parts.append(f"status:{status}")
+    if media_type:
+        parts.append('media_type:"' + media_type.replace('"', '""') + '"')
+    return ' AND '.join(parts)
+
+
+def search(connection, query=None, since=None, until=None, statuses=(), media_type=None,
+           chat_id=None, limit=20, newest=False):
+    """Matching messages as dicts, best match (or newest) first"""
+    match = build_match(query, statuses, media_type)
+    conditions = []
+    params = []
+    if match:
+        conditions.append("messages_fts MATCH ?")
+        params.append(match)
+        if since or until:
+            # Index rows are added as messages arrive, so a time range covers a
+            # narrow id range; bounding rowid lets FTS5 skip the rest of each
+            # term's doclist instead of filtering every match afterwards.
+            id_range = connection.execute(
+                "SELECT MIN(id), MAX(id) FROM search_index WHERE time >= ? AND time <= ?",
+                (since or '', until or '\uffff')
+            ).fetchone()
+            if id_range[0] is None:
+                return []
+            conditions.append("messages_fts.rowid BETWEEN ? AND ?")
+            params.extend(id_range)
+    if since:
+        conditions.append("s.time >= ?")
+        params.append(since)
+    if until:
+        conditions.append("s.time <= ?")
+        params.append(until)
+    if chat_id is not None:
+        conditions.append("s.chat_id = ?")
+        params.append(chat_id)
+
+    if match:
+        sql = (
+            "SELECT s.chat_id, s.message_id, s.time, s.status, s.media_type, "
+            "snippet(messages_fts, 0, '[', ']', '…', 16), messages_fts.rank "
+            "FROM messages_fts JOIN search_index s ON s.id = messages_fts.rowid "
+        )
+        # rowid order is arrival order and needs no sort
+        order = "messages_fts.rowid DESC" if newest else "messages_fts.rank"
+    else:
+        # No text condition: plain time-ordered listing off the time index
+        sql = "SELECT chat_id, message_id, time, status, media_type, text, NULL FROM search_index s "
+        order = "s.time DESC"
+    if conditions:
+        sql += "WHERE " + " AND ".join(conditions) + " "
+    sql += f"ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    rows = connection.execute(sql, params).fetchall()
+    return [
+        {
+            'chat_id': row[0],
+            'message_id': row[1],
+            'time': row[2],
+            'status': row[3] or None,
+            'media_type': row[4],
+            'snippet': row[5],
+            'rank': row[6],
+        }
+        for row in rows
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('query', nargs='?', help='FTS5 query (omit to list messages by time)')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'message store path (default {DEFAULT_DB})')
+    parser.add_argument('--since', type=parse_time, help="start time: '7d', '12h', 'YYYY-MM-DD[ HH:MM[:SS]]'")
+    parser.add_argument('--until', type=lambda value: parse_time(value, end=True), help='end time, same formats')
+    parser.add_argument('--status', action='append', choices=('edited', 'deleted'), default=[],
+                        help='only edited and/or deleted messages (repeatable)')
+    parser.add_argument('--media', help="only this media type, e.g. Photo, Video, 'Voice Message'")
+    parser.add_argument('--chat', type=int, help='only this chat id')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--newest', action='store_true', help='sort by time instead of relevance')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"message store {args.db!r} not found")
+    connection = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    if not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone():
+        parser.error(f"{args.db!r} has no search index yet; start the tracker once with it enabled")
+
+    options = dict(since=args.since, until=args.until, statuses=args.status, media_type=args.media,
+                   chat_id=args.chat, limit=args.limit, newest=args.newest)
+    started = time.perf_counter()
+    try:
+        results = search(connection, args.query, **options)
+    except sqlite3.OperationalError:
+        # Not valid FTS5 syntax (stray quote, unknown column:...): search the words literally
+        if not args.query:
+            raise
+        results = search(connection, quote_terms(args.query), **options)
+    elapsed = time.perf_counter() - started
+
+    for result in results:
+        if args.json:
+            sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+            continue
+        status = f" [{result['status']}]" if result['status'] else ''
+        media = f" 📎 {result['media_type']}" if result['media_type'] else ''
+        print(f"🕐 {result['time']}  🆔 {result['message_id']}{status}{media}")
+        if result['snippet']:
+            print(f"   {result['snippet']}")
+    if not args.json:
+        print(f"\n{len(results)} result(s) in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
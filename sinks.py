@@ -0,0 +1,249 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from render import format_time, split_message
+
+
+# Records that still reach Telegram when it only receives summaries
+CONTROL_EVENTS = ('tracker_started', 'tracker_stopped')
+
+SUMMARY_LABELS = {
+    'new_message': "📨 New messages",
+    'new_message_media': "📎 Media messages",
+    'new_album': "🖼️ Albums",
+    'message_edited': "✏️ Edits",
+    'message_deleted': "🗑️ Deletions",
+    'action_started': "⌨️ Activity sessions",
+    'media': "💾 Media files saved",
+}
+
+
+class LogMessage:
+    """Log queue job sending one message to the log chat
+
+    The text is kept on the job so messages still queued at shutdown can
+    be saved and sent after the next start.
+    """
+    __slots__ = ('client', 'chat_id', 'text')
+
+    def __init__(self, client, chat_id, text):
+        self.client = client
+        self.chat_id = chat_id
+        self.text = text
+
+    def __call__(self):
+        return self.client.send_message(self.chat_id, self.text)
+
+
+class TelegramSink:
+    """Send log records to the log chat through the outbound log queue
+
+    Records carry their rendered chat message under 'log' (None for
+    archive-only records). `mode` is 'full' (every message), 'summary'
+    (only start/stop messages plus a periodic count of everything else)
+    or 'off'.
+    """
+
+    def __init__(self, client, log_chat_id, log_queue, mode='full', summary_interval=3600):
+        self.client = client
+        self.log_chat_id = log_chat_id
+        self.log_queue = log_queue
+        self.mode = mode
+        self.summary_interval = summary_interval
+        self.counts = {}
+        self.summary_task = None
+
+    def start(self, supervisor):
+        if self.mode == 'summary' and self.summary_task is None:
+            self.summary_task = supervisor.spawn('log summaries', self._summaries)
+
+    async def _send(self, text, block=False):
+        # Longer than Telegram's message limit: sent as several messages instead of failing
+        for chunk in split_message(text):
+            await self.log_queue.put(LogMessage(self.client, self.log_chat_id, chunk), block=block)
+
+    async def emit(self, record, block=False):
+        if self.mode == 'summary' and record['event'] == 'tracker_stopped':
+            # The last counts go out before the stop message
+            await self.send_summary()
+        if self.mode == 'full' or (self.mode == 'summary' and record['event'] in CONTROL_EVENTS):
+            if record.get('log'):
+                await self._send(record['log'], block)
+        elif self.mode == 'summary':
+            self.counts[record['event']] = self.counts.get(record['event'], 0) + 1
+
+    async def _summaries(self):
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            await self.send_summary()
+
+    async def send_summary(self):
+        """Send and reset the counts gathered since the last summary"""
+        if not self.counts:
+            return
+        counts, self.counts = self.counts, {}
+        lines = [f"📊 **Activity Summary**\n🕐 {format_time(time.time())}"]
+        for event, count in sorted(counts.items()):
+            lines.append(f"{SUMMARY_LABELS.get(event, event)}: {count}")
+        await self._send('\n'.join(lines))
+
+    async def close(self):
+        if self.summary_task:
+            self.summary_task.cancel()
+            self.summary_task = None
+            await self.send_summary()
+
+
+class ArchiveSink:
+    """Append log records to compressed, rotating JSONL files
+
+    Records are buffered and written in batches on a dedicated thread, so
+    the event loop only ever appends to a list. A new file is started once
+    the current one reaches `max_bytes` (uncompressed) or `max_age` seconds.
+    The rendered chat message ('log') is left out; the structured fields
+    already hold its content.
+    """
+
+    def __init__(self, directory, compression='gzip', max_bytes=64 * 1024 * 1024,
+                 max_age=24 * 3600, batch_size=100, flush_interval=2.0):
+        self.zstandard = None
+        if compression == 'zstd':
+            # Optional, and only imported when zstd archiving is configured
+            try:
+                import zstandard
+                self.zstandard = zstandard
+            except ImportError:
+                print("⚠️  zstandard is not installed; archiving with gzip instead")
+                compression = 'gzip'
+        self.directory = directory
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+        self.buffer = []
+        self.wakeup = asyncio.Event()
+        self.writer_task = None
+        self.closing = False
+
+        # Current segment
+        self.file = None
+        self.raw_file = None
+        self.path = None
+        self.segment_bytes = 0
+        self.segment_started = 0.0
+
+        # Counters
+        self.records = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, supervisor):
+        if self.writer_task is None:
+            self.writer_task = supervisor.spawn('archive writer', self._writer)
+
+    async def emit(self, record, block=False):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    async def _writer(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered records in one batch"""
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._write, batch)
+        except Exception as e:
+            print(f"Error writing archive: {e}")
+
+    def _open(self):
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = 'zst' if self.compression == 'zstd' else 'gz'
+        path = os.path.join(self.directory, f"archive_{stamp}.jsonl.{extension}")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"archive_{stamp}_{suffix}.jsonl.{extension}")
+            suffix += 1
+        if self.compression == 'zstd':
+            self.raw_file = open(path, 'ab')
+            self.file = self.zstandard.ZstdCompressor().stream_writer(self.raw_file)
+        else:
+            self.raw_file = None
+            self.file = gzip.open(path, 'ab')
+        self.path = path
+        self.segment_bytes = 0
+        self.segment_started = time.time()
+
+    def _close_segment(self):
+        if self.file is None:
+            return
+        self.file.close()
+        if self.raw_file is not None and not self.raw_file.closed:
+            self.raw_file.close()
+        self.file = None
+        self.raw_file = None
+
+    def _write(self, batch):
+        if self.file is not None and (
+            self.segment_bytes >= self.max_bytes
+            or time.time() - self.segment_started >= self.max_age
+        ):
+            self._close_segment()
+            self.rotations += 1
+        if self.file is None:
+            self._open()
+
+        data = ''.join(
+            json.dumps({key: value for key, value in record.items() if key != 'log'},
+                       ensure_ascii=False, default=str) + '\n'
+            for record in batch
+        ).encode()
+        self.file.write(data)
+        # Sync-flush so a crash loses at most the batch being written
+        if self.compression == 'zstd':
+            self.file.flush(self.zstandard.FLUSH_BLOCK)
+        else:
+            self.file.flush()
+        self.segment_bytes += len(data)
+        self.bytes_written += len(data)
+        self.records += len(batch)
+
+    async def close(self):
+        if self.writer_task:
+            # Stopped with a flag, as in MessageStore.close()
+            self.closing = True
+            self.wakeup.set()
+            await self.writer_task
+            self.writer_task = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close_segment)
+        self.executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'buffered': len(self.buffer),
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'rotations': self.rotations,
+            'path': self.path,
+        }
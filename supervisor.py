@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import time
+
+
+class Supervisor:
+    """Own the tracker's background workers and in-flight event handlers
+
+    `spawn` runs a worker (a coroutine function) in a task and restarts it
+    with exponential backoff whenever it crashes; a worker that returns is
+    done. The backoff resets once a worker has stayed up for
+    `healthy_after` seconds. `run` executes an event handler with at most
+    `handler_limit` handlers running at once and keeps track of them, so
+    shutdown can wait for the ones still in flight.
+    """
+
+    def __init__(self, handler_limit=64, backoff=1.0, max_backoff=60.0, healthy_after=60.0):
+        self.handler_slots = asyncio.Semaphore(handler_limit)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.healthy_after = healthy_after
+        self.workers = {}  # Name -> task
+        self.handlers = set()
+
+        # Counters
+        self.restarts = 0
+        self.handled = 0
+
+    def spawn(self, name, worker):
+        """Start a supervised worker; returns its task (cancel it to stop the worker)"""
+        task = asyncio.create_task(self._supervise(name, worker))
+        self.workers[name] = task
+        task.add_done_callback(lambda done: self.workers.pop(name, None) if self.workers.get(name) is done else None)
+        return task
+
+    async def _supervise(self, name, worker):
+        delay = self.backoff
+        while True:
+            started = time.monotonic()
+            try:
+                await worker()
+                return
+            except Exception as e:
+                if time.monotonic() - started >= self.healthy_after:
+                    delay = self.backoff
+                self.restarts += 1
+                print(f"⚠️  {name} crashed ({e!r}); restarting in {delay:g}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def run(self, coro):
+        """Run a handler coroutine within the concurrency limit"""
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            async with self.handler_slots:
+                return await coro
+        finally:
+            self.handlers.discard(task)
+            self.handled += 1
+
+    async def drain(self, timeout):
+        """Wait up to `timeout` seconds for in-flight handlers; returns how many are still running"""
+        pending = self.handlers - {asyncio.current_task()}
+        if pending and timeout > 0:
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        if pending:
+            print(f"⚠️  {len(pending)} event handler(s) still running at shutdown")
+        return len(pending)
+
+    def stats(self):
+        return {
+            'workers': sorted(self.workers),
+            'handlers_in_flight': len(self.handlers),
+            'handled': self.handled,
+            'restarts': self.restarts,
+        }
+
+
+class UnfinishedWork:
+    """Work left over at shutdown, saved as JSON so the next start can resume it
+
+    Holds `logs` (rendered log messages not yet sent to the log chat) and
+    `media` (MediaJob.dump() dicts of media not yet copied).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {'logs': [], 'media': []}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable unfinished work file: {e}")
+            return {'logs': [], 'media': []}
+        return {'logs': data.get('logs', []), 'media': data.get('media', [])}
+
+    def save(self, logs, media):
+        """Write the leftovers (or remove the file when there are none)"""
+        if not self.path:
+            return
+        if not logs and not media:
+            self.clear()
+            return
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'saved_at': time.time(), 'logs': logs, 'media': media}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            print(f"💾 Saved {len(logs)} unsent log(s) and {len(media)} media job(s) to {self.path}")
+        except OSError as e:
+            print(f"⚠️  Could not save unfinished work: {e}")
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,10 +1,13 @@
-import os
+import time
+
+# Reported by --profile-startup
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import asyncio
-import nest_asyncio
-from datetime import datetime
+import signal
+from functools import partial
 
-# Allow nested asyncio loops
-nest_asyncio.apply()
 from telethon import TelegramClient, events
 from telethon.tl.types import (
     SendMessageTypingAction,
@@ -13,9 +16,28 @@ from telethon.tl.types import (
     SendMessageUploadAudioAction,
     SendMessageRecordAudioAction,
     SendMessageUploadPhotoAction,
-    SendMessageUploadDocumentAction
+    SendMessageUploadDocumentAction,
+    SendMessageCancelAction
 )
 
+from message_cache import CachedMessage, MessageCache, cache_key
+from edit_history import EditHistory, render_diff
+from render import fit_caption, format_time, format_time_ms, render
+from message_store import MessageStore
+from log_queue import LogQueue
+from activity import ActivitySessions
+from albums import AlbumBatcher
+from media_pipeline import MediaJob, MediaPipeline
+from media_store import MediaStore
+from media_dedup import MediaDedupCache
+from entity_resolver import EntityResolver
+from metrics import Metrics
+from catch_up import CatchUp, CatchUpEvent
+from sinks import ArchiveSink, LogMessage, TelegramSink
+from supervisor import Supervisor, UnfinishedWork
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
 # Configuration variables - modify these or set in .env file
 # Telegram API credentials (get from https://my.telegram.org)
 API_ID = 12345
@@ -33,64 +55,236 @@ LOG_CHAT_ID = -4832264586
 # Download directory for media files
 DOWNLOAD_DIR = 'downloads'
 
+# Resolved target user / log chat (ids and access hashes) for fast restarts (None to disable)
+ENTITY_CACHE_PATH = 'entities.json'
+
+# Message cache limits (edit/delete detection only works for cached messages)
+MESSAGE_CACHE_MAX_ENTRIES = 50000
+MESSAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+MESSAGE_CACHE_TTL = 7 * 24 * 3600  # Seconds since last access, None to disable
+
+# Persistent message store so edit/delete detection survives restarts (None to disable)
+MESSAGE_STORE_PATH = 'messages.db'
+MESSAGE_STORE_BATCH_SIZE = 200
+MESSAGE_STORE_FLUSH_INTERVAL = 1.0  # Seconds between batched writes
+MESSAGE_STORE_SEARCH_INDEX = True  # Full-text index for search.py
+
+# Catch-up on edits/deletes/messages missed while the tracker was down (needs the message store)
+CATCHUP_MAX_MESSAGES = 1000  # Newest missed messages fetched at most (0 to disable catch-up)
+CATCHUP_RECHECK_LIMIT = 500  # Newest stored messages re-checked for edits/deletes
+CATCHUP_BATCH_DELAY = 1.0  # Seconds between history requests
+
+# Outbound log queue (Telegram allows roughly one message per second per chat)
+LOG_QUEUE_SIZE = 1000
+LOG_RATE_PER_SECOND = 1.0
+LOG_RATE_BURST = 5
+LOG_MAX_RETRIES = 5
+LOG_PUT_TIMEOUT = 5.0  # Seconds a handler waits for room before the log is dropped
+LOG_DRAIN_TIMEOUT = 10.0  # Seconds allowed to flush queued logs on shutdown
+
+# What reaches the log chat: 'full' (every log and media file), 'summary'
+# (start/stop plus a periodic activity count) or 'off'
+TELEGRAM_LOG_MODE = 'full'
+TELEGRAM_SUMMARY_INTERVAL = 3600  # Seconds between summaries in 'summary' mode
+
+# Local archive of every log record as compressed, rotating JSONL files (None to disable)
+ARCHIVE_DIR = 'archive'
+ARCHIVE_COMPRESSION = 'gzip'  # 'gzip' or 'zstd' (needs the zstandard package)
+ARCHIVE_MAX_BYTES = 64 * 1024 * 1024  # Uncompressed bytes per file before rotating
+ARCHIVE_MAX_AGE = 24 * 3600  # Seconds per file before rotating
+ARCHIVE_BATCH_SIZE = 100
+ARCHIVE_FLUSH_INTERVAL = 2.0  # Seconds between batched writes
+
+# Seconds without a repeat before a typing/recording session is considered over
+ACTIVITY_IDLE_TIMEOUT = 8.0
+
+# Media download/re-upload workers
+MEDIA_WORKERS = 3
+MEDIA_MEMORY_THRESHOLD = 10 * 1024 * 1024  # Files up to this size never touch disk
+MEDIA_QUEUE_SIZE = 100
+MEDIA_DRAIN_TIMEOUT = 30.0  # Seconds allowed to finish queued media on shutdown
+ALBUM_WINDOW = 0.6  # Seconds to wait for the rest of an album before copying it as one
+MEDIA_DEDUP_MAX_ENTRIES = 5000  # Media already in the log chat, reused instead of re-uploaded (0 to disable)
+MEDIA_STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Disk quota for DOWNLOAD_DIR; least recently used files go first
+MEDIA_STORE_MAX_AGE = 30 * 24 * 3600  # Seconds a file may go unused before it is removed (None to keep)
+
+# Background workers are restarted with exponential backoff if they crash
+HANDLER_CONCURRENCY = 64  # Event handlers running at once; further events wait for a slot
+WORKER_RESTART_BACKOFF = 1.0  # Seconds before the first restart, doubling on repeated crashes
+WORKER_RESTART_MAX_BACKOFF = 60.0
+SHUTDOWN_TIMEOUT = 45.0  # Seconds to drain handlers, media and logs on SIGTERM/SIGINT
+UNFINISHED_WORK_PATH = 'unfinished.json'  # Logs/media left over at shutdown, resumed on the next start (None to disable)
+
+# Run on uvloop's faster event loop when it is installed (also: --uvloop)
+USE_UVLOOP = False
+
+# Prometheus-style metrics on http://METRICS_HOST:METRICS_PORT/ (port None to disable)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9464
+METRICS_SUMMARY_INTERVAL = 600  # Seconds between console summaries (None to disable)
+
+# Emoji and description for each chat action, looked up by exact type
+ACTION_LABELS = {
+    SendMessageTypingAction: ("⌨️", "typing"),
+    SendMessageRecordVideoAction: ("🎥", "recording a video message"),
+    SendMessageUploadVideoAction: ("📹", "sending a video"),
+    SendMessageRecordAudioAction: ("🎤", "recording a voice message"),
+    SendMessageUploadAudioAction: ("🔊", "sending an audio file"),
+    SendMessageUploadPhotoAction: ("🖼️", "sending a photo"),
+    SendMessageUploadDocumentAction: ("📄", "sending a file"),
+}
+
 class TelegramTracker:
-    def __init__(self):
-        self.client = TelegramClient(
+    def __init__(self, client=None, profile_startup=False):
+        # A client can be passed in (e.g. the benchmark's fake client)
+        self.client = client or TelegramClient(
             SESSION_NAME,
             API_ID,
             API_HASH
         )
+        self.profile_startup = profile_startup
+        self.startup_phases = [('imports', IMPORT_SECONDS)]
+        # Owns background workers (restarting them if they crash) and bounds concurrent handlers
+        self.supervisor = Supervisor(
+            handler_limit=HANDLER_CONCURRENCY,
+            backoff=WORKER_RESTART_BACKOFF,
+            max_backoff=WORKER_RESTART_MAX_BACKOFF
+        )
+        self.unfinished_work = UnfinishedWork(UNFINISHED_WORK_PATH)
+        self.resuming = []  # Saved media jobs not yet handed back to the pipeline
+        self.resume_task = None
+        self.shutdown_requested = asyncio.Event()
+        self.event_handlers = []
         self.target_user = None
         self.target_user_id = None
         self.log_chat_id = LOG_CHAT_ID
-        self.message_cache = {}  # Cache to track original messages for edit/delete detection
-        
-        # Create download directory if it doesn't exist
-        if not os.path.exists(DOWNLOAD_DIR):
-            os.makedirs(DOWNLOAD_DIR)
+        self.entity_resolver = EntityResolver(self.client, ENTITY_CACHE_PATH)
+        self.metrics = Metrics()
+        # Cache to track original messages for edit/delete detection
+        self.message_cache = MessageCache(
+            max_entries=MESSAGE_CACHE_MAX_ENTRIES,
+            max_bytes=MESSAGE_CACHE_MAX_BYTES,
+            ttl=MESSAGE_CACHE_TTL
+        )
+        # Durable copy of tracked messages; the cache above is its hot tier
+        self.message_store = MessageStore(
+            MESSAGE_STORE_PATH,
+            batch_size=MESSAGE_STORE_BATCH_SIZE,
+            flush_interval=MESSAGE_STORE_FLUSH_INTERVAL,
+            search_index=MESSAGE_STORE_SEARCH_INDEX
+        ) if MESSAGE_STORE_PATH else None
+        # Logs are queued and sent by a background task so handlers never wait on the network
+        self.log_queue = LogQueue(
+            maxsize=LOG_QUEUE_SIZE,
+            rate=LOG_RATE_PER_SECOND,
+            burst=LOG_RATE_BURST,
+            max_retries=LOG_MAX_RETRIES,
+            put_timeout=LOG_PUT_TIMEOUT
+        )
+        # Every log record goes to each sink: the log chat and/or the local archive
+        self.sinks = [TelegramSink(
+            self.client,
+            self.log_chat_id,
+            self.log_queue,
+            mode=TELEGRAM_LOG_MODE,
+            summary_interval=TELEGRAM_SUMMARY_INTERVAL
+        )]
+        if ARCHIVE_DIR:
+            self.sinks.append(ArchiveSink(
+                ARCHIVE_DIR,
+                compression=ARCHIVE_COMPRESSION,
+                max_bytes=ARCHIVE_MAX_BYTES,
+                max_age=ARCHIVE_MAX_AGE,
+                batch_size=ARCHIVE_BATCH_SIZE,
+                flush_interval=ARCHIVE_FLUSH_INTERVAL
+            ))
+        # Repeated typing/recording updates are coalesced into one session per action type
+        self.activity_sessions = ActivitySessions(
+            ACTIVITY_IDLE_TIMEOUT,
+            on_start=self.log_action_start,
+            on_end=self.log_action_end,
+            supervisor=self.supervisor
+        )
+        # Messages of one album arrive as separate events; copy them as one album
+        self.album_batcher = AlbumBatcher(ALBUM_WINDOW, on_album=self.process_album, supervisor=self.supervisor)
+        # Files that reach disk are kept by content hash under DOWNLOAD_DIR, within a quota
+        self.media_store = MediaStore(
+            DOWNLOAD_DIR,
+            max_bytes=MEDIA_STORE_MAX_BYTES,
+            max_age=MEDIA_STORE_MAX_AGE
+        )
+        # Media is copied by background workers so text logs never wait behind a download
+        self.media_pipeline = MediaPipeline(
+            self.client,
+            self.log_chat_id,
+            self.send_log,
+            self.media_store,
+            workers=MEDIA_WORKERS,
+            memory_threshold=MEDIA_MEMORY_THRESHOLD,
+            queue_size=MEDIA_QUEUE_SIZE,
+            dedup=MediaDedupCache(MEDIA_DEDUP_MAX_ENTRIES) if MEDIA_DEDUP_MAX_ENTRIES else None,
+            metrics=self.metrics,
+            upload=TELEGRAM_LOG_MODE == 'full',
+            record_media=self.record_media
+        )
+        self.register_metrics()
+        self.catch_up = CatchUp(
+            self,
+            max_messages=CATCHUP_MAX_MESSAGES,
+            recheck_limit=CATCHUP_RECHECK_LIMIT,
+            batch_delay=CATCHUP_BATCH_DELAY
+        ) if self.message_store and CATCHUP_MAX_MESSAGES else None
+        self.catch_up_task = None
+    
+    def record_phase(self, name, started):
+        """Note how long a startup phase took; returns the time it ended"""
+        now = time.perf_counter()
+        self.startup_phases.append((name, now - started))
+        return now
+    
+    async def start_client(self):
+        started = time.perf_counter()
+        await self.client.start()
+        self.record_phase('client.start()', started)
+        print("✓ Client started successfully!")
+    
+    async def start_components(self):
+        """Open local stores and start background workers"""
+        started = time.perf_counter()
+        if self.message_store:
+            await self.message_store.start(self.supervisor)
+        self.log_queue.start(self.supervisor)
+        for sink in self.sinks:
+            sink.start(self.supervisor)
+        await self.media_store.start()
+        self.media_pipeline.start(self.supervisor)
+        self.record_phase('local components', started)
     
     async def start(self):
         """Start the tracker"""
-        await self.client.start()
+        started = time.perf_counter()
+        # Local stores open on their own threads while the client connects
+        await asyncio.gather(self.start_client(), self.start_components())
         
-        print("✓ Client started successfully!")
+        if METRICS_PORT:
+            try:
+                await self.metrics.serve(METRICS_HOST, METRICS_PORT)
+                print(f"✓ Metrics on http://{METRICS_HOST}:{METRICS_PORT}/")
+            except OSError as e:
+                print(f"⚠️  Warning: Could not start metrics endpoint: {e}")
+        self.metrics.start_summary(METRICS_SUMMARY_INTERVAL, self.supervisor)
         
-        # Get target user by iterating through dialogs
+        # Resolve target user and log chat (cached input peers, direct lookup, then one dialog scan)
         print(f"🔍 Searching for target user: {TARGET_USER}")
-        print(f"   Scanning through your dialogs...")
+        log_chat = None
         try:
-            self.target_user = None
-            dialog_count = 0
-            
-            # Iterate through all dialogs to find the target user
-            async for dialog in self.client.iter_dialogs():
-                entity = dialog.entity
-                dialog_count += 1
-                
-                # Check if this is a user (not a group or channel)
-                if hasattr(entity, 'id'):
-                    # Match by ID (if TARGET_USER is numeric)
-                    if isinstance(TARGET_USER, int) and entity.id == TARGET_USER:
-                        self.target_user = entity
-                        print(f"   ✓ Found after scanning {dialog_count} dialogs")
-                        break
-                    # Match by username (if TARGET_USER is a string)
-                    elif isinstance(TARGET_USER, str):
-                        username = getattr(entity, 'username', None)
-                        if username and username.lower() == TARGET_USER.lower().replace('@', ''):
-                            self.target_user = entity
-                            print(f"   ✓ Found after scanning {dialog_count} dialogs")
-                            break
-                        # Also try matching by first name
-                        first_name = getattr(entity, 'first_name', None)
-                        if first_name and first_name.lower() == TARGET_USER.lower():
-                            self.target_user = entity
-                            print(f"   ✓ Found after scanning {dialog_count} dialogs")
-                            break
+            phase_started = time.perf_counter()
+            self.target_user, log_chat = await self.entity_resolver.resolve(TARGET_USER, self.log_chat_id)
+            self.record_phase('entity resolution', phase_started)
+            print(f"   Resolved {self.entity_resolver.report()}")
             
             if not self.target_user:
                 print(f"✗ Error: Could not find target user '{TARGET_USER}' in your dialogs")
-                print(f"  Scanned {dialog_count} dialogs total")
                 print(f"  Make sure you have a chat/conversation with this user")
                 return False
             
@@ -103,35 +297,22 @@ class TelegramTracker:
             return False
         
         # Verify log chat
-        try:
-            if self.log_chat_id == 'me':
-                self.log_chat_id = 'me'
-                print(f"✓ Log destination: Saved Messages")
-            else:
-                # Try to find the log chat in dialogs
-                log_chat = None
-                async for dialog in self.client.iter_dialogs():
-                    if dialog.entity.id == self.log_chat_id:
-                        log_chat = dialog.entity
-                        break
-                
-                if log_chat:
-                    print(f"✓ Log destination: {getattr(log_chat, 'title', getattr(log_chat, 'first_name', 'Unknown'))}")
-                else:
-                    # If not found in dialogs, try direct entity fetch as fallback
-                    try:
-                        log_chat = await self.client.get_entity(self.log_chat_id)
-                        print(f"✓ Log destination: {getattr(log_chat, 'title', getattr(log_chat, 'first_name', 'Unknown'))}")
-                    except:
-                        print(f"⚠️  Warning: Could not verify log chat, but will attempt to use it")
-        except Exception as e:
-            print(f"⚠️  Warning: Error verifying log chat: {str(e)}")
+        if self.log_chat_id == 'me':
+            print(f"✓ Log destination: Saved Messages")
+        elif log_chat:
+            print(f"✓ Log destination: {getattr(log_chat, 'title', getattr(log_chat, 'first_name', 'Unknown'))}")
+        else:
+            print(f"⚠️  Warning: Could not verify log chat, but will attempt to use it")
             print(f"   Will attempt to use log chat ID: {self.log_chat_id}")
         
+        # Logs and media left unfinished by the last run go out first
+        await self.resume_unfinished()
+        
         # Send startup message
-        await self.send_log(f"🤖 **Tracker Started**\n"
-                           f"📱 Monitoring: {self.target_user.first_name} (@{self.target_user.username or 'no username'})\n"
-                           f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        now = time.time()
+        await self.send_log(render('tracker_started', name=self.target_user.first_name,
+                                   username=self.target_user.username or 'no username', time=format_time(now)),
+                            kind='tracker_started', ts=now, target_user_id=self.target_user_id)
         
         print("\n🔍 Tracker is now active! Listening to all activities...")
         print(f"   Filtering for user: {self.target_user.first_name} (@{self.target_user.username or 'no username'})")
@@ -141,262 +322,412 @@ class TelegramTracker:
         print(f"      • Recording video/audio")
         print(f"      • Uploading video/audio/photo/document")
         print(f"      • All user activities")
-        print("Press Ctrl+C to stop.\n")
         
         # Register event handlers
+        phase_started = time.perf_counter()
         self.register_handlers()
+        self.record_phase('handler registration', phase_started)
+        
+        print(f"   ⏱ Startup took {time.perf_counter() - started:.2f}s")
+        if self.profile_startup:
+            self.print_startup_profile()
+        print("Press Ctrl+C to stop.\n")
+        
+        # Replay what was missed while offline, in the background so live events are not held up
+        if self.catch_up:
+            self.catch_up_task = self.supervisor.spawn(
+                'catch-up', partial(self.catch_up.run, self.target_user, self.target_user_id))
         
         return True
     
+    def print_startup_profile(self):
+        """Time spent in each startup phase (--profile-startup)"""
+        print("   ⏱ Startup profile:")
+        for name, seconds in self.startup_phases:
+            note = "  (concurrent with client.start())" if name == 'local components' else ""
+            print(f"      {name:<22}{seconds * 1000:9.1f} ms{note}")
+    
+    async def resume_unfinished(self):
+        """Queue logs and media jobs saved at the last shutdown"""
+        work = self.unfinished_work.load()
+        if not work['logs'] and not work['media']:
+            return
+        print(f"↩️  Resuming {len(work['logs'])} unsent log(s) and {len(work['media'])} media job(s) from the last run")
+        for text in work['logs']:
+            await self.log_queue.put(LogMessage(self.client, self.log_chat_id, text), block=True)
+        self.resuming = work['media']
+        if self.resuming:
+            # Messages have to be fetched again, so this runs in the background
+            self.resume_task = self.supervisor.spawn('media resume', self.resume_media)
+        else:
+            self.unfinished_work.clear()
+    
+    async def resume_media(self):
+        """Fetch the messages of saved media jobs and hand the jobs back to the pipeline"""
+        while self.resuming:
+            data = self.resuming[0]
+            items = data['album'] or [data]
+            messages = await self.client.get_messages(data['chat_id'], ids=[item['message_id'] for item in items])
+            jobs = []
+            for item, message in zip(items, messages):
+                if message is None or not message.media:
+                    print(f"⚠️  Message {item['message_id']} no longer exists; skipping its media")
+                    continue
+                jobs.append(MediaJob(message, item['media_type'], item['caption'], item['log_header']))
+            if jobs:
+                if data['album']:
+                    job = MediaJob(jobs[0].message, data['media_type'], data['caption'], data['log_header'], album=jobs)
+                else:
+                    job = jobs[0]
+                await self.media_pipeline.submit(job)
+            self.resuming.pop(0)
+        self.unfinished_work.clear()
+        self.resume_task = None
+    
     def register_handlers(self):
         """Register all event handlers"""
         
-        # Handle ALL new messages - filter inside the handler
-        @self.client.on(events.NewMessage())
+        metrics = self.metrics
+        run = self.supervisor.run
+        
+        # Handle new messages from the target user (filtered by the event builder)
+        @self.client.on(events.NewMessage(from_users=self.target_user_id))
         async def handle_new_message(event):
-            # Only process if message is from target user
-            if event.sender_id == self.target_user_id:
-                await self.process_message(event)
+            metrics.inc('tracker_events_total', type='new_message')
+            await run(metrics.track('tracker_handler', self.process_message(event), handler='process_message'))
         
-        # Handle ALL message edits - filter inside the handler
-        @self.client.on(events.MessageEdited())
+        # Handle message edits from the target user (filtered by the event builder)
+        @self.client.on(events.MessageEdited(from_users=self.target_user_id))
         async def handle_message_edit(event):
-            # Only process if message is from target user
-            if event.sender_id == self.target_user_id:
-                await self.process_message_edit(event)
+            metrics.inc('tracker_events_total', type='message_edited')
+            await run(metrics.track('tracker_handler', self.process_message_edit(event), handler='process_message_edit'))
         
-        # Handle message deletions
+        # Handle message deletions (no sender on these; filtered against the cache)
         @self.client.on(events.MessageDeleted())
         async def handle_message_delete(event):
-            await self.process_message_delete(event)
+            metrics.inc('tracker_events_total', type='message_deleted')
+            await run(metrics.track('tracker_handler', self.process_message_delete(event), handler='process_message_delete'))
         
-        # Handle user status updates (online/offline) via events
+        # Handle user actions (typing, recording, uploading) via events
         @self.client.on(events.UserUpdate())
         async def handle_user_update(event):
+            # Compare the raw id so unrelated contacts never cost an entity fetch
+            if event.user_id != self.target_user_id or event.action is None:
+                return
+            metrics.inc('tracker_events_total', type='user_action')
             try:
-                # Get the user entity from the event
-                user = await event.get_user()
-                
-                # Only process if this is our target user
-                if user and user.id == self.target_user_id:
-                    # Process typing actions
-                    if event.typing:
-                        await self.process_user_action(event)
-                        
+                await run(metrics.track('tracker_handler', self.process_user_action(event), handler='process_user_action'))
             except Exception as e:
                 pass  # Silent fail
+        
+        # Kept so shutdown can stop taking new events
+        self.event_handlers = [handle_new_message, handle_message_edit, handle_message_delete, handle_user_update]
+    
+    def register_metrics(self):
+        """Expose component counters and sizes, read only when metrics are scraped"""
+        register = self.metrics.register
+        supervisor = self.supervisor
+        register('tracker_handlers_in_flight', 'gauge', lambda: len(supervisor.handlers),
+                 'Event handlers running or waiting for a slot')
+        register('tracker_worker_restarts_total', 'counter', lambda: supervisor.restarts,
+                 'Background workers restarted after a crash')
+        
+        cache = self.message_cache
+        register('tracker_message_cache_entries', 'gauge', lambda: len(cache), 'Messages in the in-memory cache')
+        register('tracker_message_cache_bytes', 'gauge', lambda: cache.total_bytes, 'Approximate cache size in bytes')
+        register('tracker_message_cache_hits_total', 'counter', lambda: cache.hits)
+        register('tracker_message_cache_misses_total', 'counter', lambda: cache.misses)
+        register('tracker_message_cache_evictions_total', 'counter', lambda: cache.evictions + cache.expirations)
+        
+        log_queue = self.log_queue
+        register('tracker_log_queue_depth', 'gauge', lambda: log_queue.depth, 'Log messages waiting to be sent')
+        register('tracker_send_log_success_total', 'counter', lambda: log_queue.sent)
+        register('tracker_send_log_failure_total', 'counter', lambda: log_queue.failed)
+        register('tracker_send_log_dropped_total', 'counter', lambda: log_queue.dropped)
+        register('tracker_send_log_retries_total', 'counter', lambda: log_queue.retries)
+        register('tracker_send_log_flood_waits_total', 'counter', lambda: log_queue.flood_waits)
+        
+        media = self.media_pipeline
+        register('tracker_media_queue_depth', 'gauge', lambda: media.depth, 'Media jobs waiting for a worker')
+        register('tracker_media_completed_total', 'counter', lambda: media.completed)
+        register('tracker_media_failed_total', 'counter', lambda: media.failed)
+        register('tracker_media_bytes_in_memory_total', 'counter', lambda: media.bytes_in_memory)
+        register('tracker_media_bytes_spooled_total', 'counter', lambda: media.bytes_spooled)
+        if media.dedup:
+            register('tracker_media_bytes_saved_total', 'counter', lambda: media.dedup.bytes_saved)
+        
+        media_store = self.media_store
+        register('tracker_media_store_bytes', 'gauge', lambda: media_store.total_bytes, 'Bytes of media kept on disk')
+        register('tracker_media_store_files', 'gauge', lambda: media_store.files)
+        register('tracker_media_store_evictions_total', 'counter', lambda: media_store.evictions)
+        
+        albums = self.album_batcher
+        register('tracker_albums_total', 'counter', lambda: albums.albums, 'Albums copied as one unit')
+        register('tracker_album_items_total', 'counter', lambda: albums.items)
+        
+        sessions = self.activity_sessions
+        register('tracker_activity_sessions_active', 'gauge', lambda: len(sessions.sessions))
+        register('tracker_activity_updates_suppressed_total', 'counter', lambda: sessions.suppressed)
+        
+        if self.message_store:
+            store = self.message_store
+            register('tracker_message_store_pending', 'gauge', lambda: len(store.pending))
+            register('tracker_message_store_writes_total', 'counter', lambda: store.writes)
     
     async def process_user_action(self, event):
         """Process user typing, recording, and upload actions"""
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        current_time_ms = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        
-        # Check if typing/uploading/recording
-        if event.typing:
-            action_text = None
-            action_emoji = None
-            action_description = None
-            
-            if isinstance(event.action, SendMessageTypingAction):
-                action_emoji = "⌨️"
-                action_text = "typing"
-                action_description = "typing"
-                
-            elif isinstance(event.action, SendMessageRecordVideoAction):
-                action_emoji = "🎥"
-                action_text = "recording a video message"
-                action_description = "recording a video message"
-                
-            elif isinstance(event.action, SendMessageUploadVideoAction):
-                action_emoji = "📹"
-                action_text = "sending a video"
-                action_description = "sending a video"
-                
-            elif isinstance(event.action, SendMessageRecordAudioAction):
-                action_emoji = "🎤"
-                action_text = "recording a voice message"
-                action_description = "recording a voice message"
-                
-            elif isinstance(event.action, SendMessageUploadAudioAction):
-                action_emoji = "🔊"
-                action_text = "sending an audio file"
-                action_description = "sending an audio file"
-                
-            elif isinstance(event.action, SendMessageUploadPhotoAction):
-                action_emoji = "🖼️"
-                action_text = "sending a photo"
-                action_description = "sending a photo"
-                
-            elif isinstance(event.action, SendMessageUploadDocumentAction):
-                action_emoji = "📄"
-                action_text = "sending a file"
-                action_description = "sending a file"
-            
-            else:
-                # Catch any other action types we might have missed
-                action_type_name = type(event.action).__name__
-                action_emoji = "📱"
-                action_text = action_type_name.replace('SendMessage', '').replace('Action', '')
-                action_description = f"User action: {action_type_name}"
-            
-            if action_text:
-                # Log to chat (Telegram-style format)
-                log_message = f"**{self.target_user.first_name}**\n"
-                log_message += f"{action_emoji} {action_text}\n"
-                log_message += f"🕐 {current_time_ms}"
-                
-                await self.send_log(log_message)
-                
-                # Print to console
-                print(f"\n{'='*50}")
-                print(f"{self.target_user.first_name}")
-                print(f"{action_emoji} {action_text}")
-                print(f"   Time: {current_time_ms}")
-                print(f"{'='*50}\n")
+        action_type = type(event.action)
+        
+        # The user stopped whatever they were doing; close open sessions now
+        if action_type is SendMessageCancelAction:
+            await self.activity_sessions.close()
+            return
+        
+        label = ACTION_LABELS.get(action_type)
+        if label is None:
+            # Catch any other action types we might have missed, and remember them
+            action_type_name = action_type.__name__
+            label = ("📱", action_type_name.replace('SendMessage', '').replace('Action', ''))
+            ACTION_LABELS[action_type] = label
+        
+        # Only the first update of a session is logged; repeats extend it
+        action_emoji, action_text = label
+        await self.activity_sessions.observe(action_type, action_emoji, action_text)
+    
+    async def log_action_start(self, session):
+        """Log the start of an activity session"""
+        current_time_ms = format_time_ms(session.started_at)
+        
+        # Log to chat (Telegram-style format)
+        log_message = render('action_started', name=self.target_user.first_name, emoji=session.emoji,
+                             action=session.text, time=current_time_ms)
+        
+        await self.send_log(log_message, kind='action_started', ts=session.started_at, action=session.text,
+                            started_at=session.started_at)
+        
+        # Print to console
+        print(f"\n{'='*50}")
+        print(f"{self.target_user.first_name}")
+        print(f"{session.emoji} {session.text}")
+        print(f"   Time: {current_time_ms}")
+        print(f"{'='*50}\n")
+    
+    async def log_action_end(self, session):
+        """Log the end of an activity session with its duration"""
+        now = time.time()
+        duration = round(session.duration)
+        
+        log_message = render('action_ended', name=self.target_user.first_name, emoji=session.emoji,
+                             action=session.text, duration=duration, updates=session.updates,
+                             time=format_time(now))
+        
+        await self.send_log(log_message, kind='action_ended', ts=now, action=session.text,
+                            started_at=session.started_at, duration=session.duration, updates=session.updates)
+        
+        print(f"{session.emoji} Stopped {session.text} after {duration}s ({session.updates} updates)")
     
     async def process_message(self, event):
         """Process and log messages from target user"""
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # The one clock read for this event; formatted only where text needs it.
+        # Caught-up messages keep the time they were actually sent.
+        now = event.time if isinstance(event, CatchUpEvent) and event.time else time.time()
         message = event.message
         
         # Cache the message for edit/delete tracking
-        self.message_cache[message.id] = {
-            'sender_id': event.sender_id,
-            'text': message.text,
-            'media': message.media is not None,
-            'media_type': self.get_media_type(message) if message.media else None,
-            'time': current_time
-        }
+        record = CachedMessage(
+            sender_id=event.sender_id,
+            text=message.text,
+            media=message.media is not None,
+            media_type=self.get_media_type(message) if message.media else None,
+            time=format_time(now),
+            chat_id=event.chat_id
+        )
+        self.message_cache.put(cache_key(event.chat_id, message.id), record)
+        if self.message_store:
+            self.message_store.save(message.id, record)
+            self.message_store.set_checkpoint(event.chat_id, message.id)
+        
+        # Album items are logged and copied together once the whole album is in
+        if message.media and message.grouped_id:
+            await self.album_batcher.add(message.grouped_id, message.id, (event, now))
+            return
+        await self.log_message(event, now)
+    
+    async def log_message(self, event, now):
+        """Log a new message and queue its media for copying"""
+        message = event.message
+        name = self.target_user.first_name
+        current_time = format_time(now)
         
         # Build log header
-        log_header = f"📨 **New Message**\n🕐 {current_time}\n"
-        log_header += f"👤 From: {self.target_user.first_name}\n"
-        log_header += f"🆔 Message ID: {message.id}\n"
-        log_header += "─" * 30 + "\n"
+        log_header = render('new_message', time=current_time, name=name, message_id=message.id)
         
         # Handle text messages
         if message.text:
-            full_log = log_header + f"💬 **Text:**\n{message.text}"
-            await self.send_log(full_log)
+            full_log = log_header + render('text', text=message.text)
+            await self.send_log(full_log, kind='new_message', ts=now, chat_id=event.chat_id,
+                                message_id=message.id, sender_id=event.sender_id, text=message.text)
         
         # Handle media messages
         if message.media:
             media_type = self.get_media_type(message)
-            log_text = log_header + f"📎 **Media Type:** {media_type}\n"
+            parts = [log_header, render('media', media_type=media_type)]
+            if message.text:
+                parts.append(render('caption', text=message.text))
+            parts.append(render('downloading'))
+            await self.send_log(''.join(parts), kind='new_message_media', ts=now, chat_id=event.chat_id,
+                                message_id=message.id, sender_id=event.sender_id,
+                                text=message.text, media_type=media_type)
             
+            # Caption for the copy sent to the log chat (the full text is in the log above)
+            caption = render('media_caption', media_type=media_type, time=current_time, name=name)
             if message.text:
-                log_text += f"💬 **Caption:** {message.text}\n"
+                caption += render('caption_text', text=message.text)
             
-            # Download media
-            try:
-                log_text += "⏳ Downloading media..."
-                await self.send_log(log_text)
-                
-                # Create unique filename
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{DOWNLOAD_DIR}/{timestamp}_{self.target_user_id}"
-                
-                # Download the file
-                downloaded_file = await message.download_media(file=filename)
-                
-                if downloaded_file:
-                    # Send the downloaded media to log chat
-                    caption = f"📎 {media_type}\n🕐 {current_time}\n👤 From: {self.target_user.first_name}"
-                    if message.text:
-                        caption += f"\n💬 Caption: {message.text}"
-                    
-                    await self.client.send_file(
-                        self.log_chat_id,
-                        downloaded_file,
-                        caption=caption
-                    )
-                    
-                    print(f"✓ Downloaded and sent: {media_type}")
-                else:
-                    await self.send_log(log_header + "❌ Failed to download media")
-                    
-            except Exception as e:
-                await self.send_log(log_header + f"❌ Error downloading media: {str(e)}")
-                print(f"Error downloading media: {e}")
+            # Download and re-upload happen on a media worker
+            await self.media_pipeline.submit(MediaJob(message, media_type, fit_caption(caption), log_header))
+    
+    async def process_album(self, items):
+        """Log and copy the messages of one album (list of (event, epoch time)) as a single unit"""
+        if len(items) == 1:
+            # Only one item arrived in time; handle it like any media message
+            await self.log_message(*items[0])
+            return
+        
+        event, now = items[0]
+        name = self.target_user.first_name
+        current_time = format_time(now)
+        messages = [item_event.message for item_event, _ in items]
+        media_types = [self.get_media_type(message) for message in messages]
+        captions = [message.text for message in messages if message.text]
+        counts = {}
+        for media_type in media_types:
+            counts[media_type] = counts.get(media_type, 0) + 1
+        summary = ', '.join(f"{count} {media_type}" for media_type, count in counts.items())
+        
+        # One header for the whole album
+        log_header = render('new_album', count=len(messages), time=current_time, name=name,
+                            message_ids=', '.join(str(message.id) for message in messages))
+        
+        parts = [log_header, render('album_media', summary=summary)]
+        parts.extend(render('caption', text=caption) for caption in captions)
+        parts.append(render('downloading'))
+        await self.send_log(''.join(parts), kind='new_album', ts=now, chat_id=event.chat_id,
+                            message_ids=[message.id for message in messages], sender_id=event.sender_id,
+                            text='\n'.join(captions) or None, media_types=media_types)
+        
+        # Caption for the album sent to the log chat
+        caption = fit_caption(render('album_caption', summary=summary, time=current_time, name=name)
+                              + ''.join(render('caption_text', text=text) for text in captions))
+        
+        # Downloaded in parallel and uploaded in one send_file call on a media worker
+        jobs = [MediaJob(message, media_type, caption, log_header)
+                for message, media_type in zip(messages, media_types)]
+        await self.media_pipeline.submit(MediaJob(messages[0], 'Album', caption, log_header, album=jobs))
     
     async def process_message_edit(self, event):
         """Process edited messages from target user"""
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Edits found by catch-up keep the time they were actually made
+        now = event.edit_time if isinstance(event, CatchUpEvent) and event.edit_time else time.time()
+        current_time = format_time(now)
+        name = self.target_user.first_name
         message = event.message
         message_id = message.id
         
         # Check if we have the original message cached
-        original = self.message_cache.get(message_id)
+        original = await self.lookup_message(message_id, event.chat_id)
         
         if original:
-            # Build edit log
-            log_header = f"✏️ **Message EDITED**\n🕐 {current_time}\n"
-            log_header += f"👤 From: {self.target_user.first_name}\n"
-            log_header += f"🆔 Message ID: {message_id}\n"
-            log_header += "─" * 30 + "\n"
+            # Extend the version chain: the first text is kept whole, each edit as a delta
+            history = original.history or EditHistory(original.text)
+            if (message.text or None) != (original.text or None):
+                history.append(original.text, message.text)
             
-            # Show original text
-            if original['text']:
-                log_header += f"❌ **Original Text:**\n{original['text']}\n\n"
-            else:
-                log_header += f"❌ **Original:** (No text)\n\n"
+            # Build edit log
+            edit_label = f" (edit #{len(history)})" if len(history) else ""
+            parts = [render('message_edited', label=edit_label, time=current_time, name=name, message_id=message_id)]
             
-            # Show new text
-            if message.text:
-                log_header += f"✅ **New Text:**\n{message.text}"
+            if original.text and message.text:
+                # Show what changed: ~~removed~~ and **added**
+                parts.append(render('changes', diff=render_diff(original.text, message.text)))
+                if len(history) > 1:
+                    parts.append(render('first_version', text=history.original or '(No text)'))
             else:
-                log_header += f"✅ **New:** (No text)"
+                # Show original text, then the new one
+                if original.text:
+                    parts.append(render('original_text', text=original.text))
+                else:
+                    parts.append(render('original_empty'))
+                if message.text:
+                    parts.append(render('new_text', text=message.text))
+                else:
+                    parts.append(render('new_empty'))
             
-            await self.send_log(log_header)
+            await self.send_log(''.join(parts), kind='message_edited', ts=now, chat_id=event.chat_id,
+                                message_id=message_id, original_text=original.text, text=message.text,
+                                version=len(history))
             
             # Update cache with new content
-            self.message_cache[message_id]['text'] = message.text
+            self.message_cache.update_text(cache_key(original.chat_id, message_id), message.text, history)
+            if self.message_store:
+                self.message_store.update_text(original.chat_id, message_id, message.text, history)
             
             print(f"✓ Detected message edit (ID: {message_id})")
         else:
             # Message not in cache, log as edited but unknown original
-            log_text = f"✏️ **Message EDITED** (original not tracked)\n🕐 {current_time}\n"
-            log_text += f"👤 From: {self.target_user.first_name}\n"
-            log_text += f"🆔 Message ID: {message_id}\n"
-            log_text += "─" * 30 + "\n"
-            log_text += f"✅ **Current Text:**\n{message.text if message.text else '(No text)'}"
+            log_text = (render('message_edited', label=" (original not tracked)", time=current_time, name=name,
+                               message_id=message_id)
+                        + render('current_text', text=message.text if message.text else '(No text)'))
             
-            await self.send_log(log_text)
+            await self.send_log(log_text, kind='message_edited', ts=now, chat_id=event.chat_id,
+                                message_id=message_id, original_text=None, text=message.text)
     
     async def process_message_delete(self, event):
         """Process deleted messages"""
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        now = time.time()
         
         # Check which cached messages were deleted
         for deleted_id in event.deleted_ids:
-            if deleted_id in self.message_cache:
-                original = self.message_cache[deleted_id]
+            # Remove from cache regardless; only this chat's message with that id
+            original = self.message_cache.pop(cache_key(event.chat_id, deleted_id))
+            if original is None and self.message_store:
+                original = await self.message_store.get(deleted_id, event.chat_id)
+            if original:
+                if self.message_store:
+                    self.message_store.mark_deleted(original.chat_id, deleted_id)
                 
                 # Only process if message was from target user
-                if original.get('sender_id') == self.target_user_id:
+                if original.sender_id == self.target_user_id:
                     # Build deletion log
-                    log_text = f"🗑️ **Message DELETED**\n🕐 {current_time}\n"
-                    log_text += f"👤 From: {self.target_user.first_name}\n"
-                    log_text += f"🆔 Message ID: {deleted_id}\n"
-                    log_text += f"📅 Original Time: {original['time']}\n"
-                    log_text += "─" * 30 + "\n"
+                    parts = [render('message_deleted', time=format_time(now), name=self.target_user.first_name,
+                                    message_id=deleted_id, original_time=original.time)]
                     
                     # Show what was deleted
-                    if original['text']:
-                        log_text += f"❌ **Deleted Text:**\n{original['text']}"
+                    if original.text:
+                        parts.append(render('deleted_text', text=original.text))
                     
-                    if original['media']:
-                        if original['text']:
-                            log_text += f"\n\n📎 **Also had media:** {original['media_type']}"
+                    if original.media:
+                        if original.text:
+                            parts.append(render('also_media', media_type=original.media_type))
                         else:
-                            log_text += f"📎 **Deleted Media:** {original['media_type']}"
+                            parts.append(render('deleted_media', media_type=original.media_type))
                     
-                    await self.send_log(log_text)
+                    await self.send_log(''.join(parts), kind='message_deleted', ts=now, chat_id=original.chat_id,
+                                        message_id=deleted_id, sender_id=original.sender_id,
+                                        text=original.text, media_type=original.media_type,
+                                        original_time=original.time)
                     
                     print(f"✓ Detected message deletion (ID: {deleted_id})")
-                
-                # Remove from cache regardless
-                del self.message_cache[deleted_id]
+    
+    async def lookup_message(self, message_id, chat_id=None):
+        """Find a tracked message in the cache, falling back to the message store"""
+        key = cache_key(chat_id, message_id)
+        original = self.message_cache.get(key)
+        if original is None and self.message_store:
+            original = await self.message_store.get(message_id, chat_id)
+            if original:
+                self.message_cache.put(key, original)
+        return original
     
     def get_media_type(self, message):
         """Determine the type of media in message"""
@@ -419,21 +750,101 @@ class TelegramTracker:
         else:
             return "Unknown Media"
     
-    async def send_log(self, message):
-        """Send log message to log chat"""
-        try:
-            await self.client.send_message(self.log_chat_id, message)
-        except Exception as e:
-            print(f"Error sending log: {e}")
+    async def send_log(self, message, kind='log', ts=None, block=False, **fields):
+        """Hand a log record to every sink (log chat, archive)
+
+        `message` is the rendered chat message; `fields` carry the same
+        content in structured form for the archive. `ts` is the event's
+        epoch time, read once when the event came in (now if omitted).
+        With `block`, the chat message waits for room in a full log queue
+        instead of being dropped.
+        """
+        record = {'event': kind, 'ts': ts or time.time(), **fields, 'log': message}
+        for sink in self.sinks:
+            await sink.emit(record, block=block)
+    
+    async def record_media(self, job, media_path, source):
+        """Archive-only record for a media file once it has been copied or downloaded"""
+        message = job.message
+        await self.send_log(None, kind='media', message_id=message.id, media_type=job.media_type,
+                            media_path=media_path, source=source,
+                            size=message.file.size if message.file else None)
+    
+    async def close(self, timeout=None, announce=False):
+        """Drain in-flight handlers, close open activity sessions, finish queued media, then flush sinks,
+        queued logs and pending message store writes, all within `timeout` seconds
+
+        With `announce`, the stop message is logged once everything else has
+        been, so it is the last thing in the log chat. Logs and media jobs
+        that did not make it are saved and resumed on the next start.
+        """
+        if timeout is None:
+            timeout = SHUTDOWN_TIMEOUT
+        deadline = time.monotonic() + timeout
+        
+        def remaining(limit=timeout):
+            return max(0.0, min(limit, deadline - time.monotonic()))
+        
+        for task in (self.catch_up_task, self.resume_task):
+            if task:
+                task.cancel()
+        await self.supervisor.drain(remaining())
+        await self.metrics.close()
+        await self.activity_sessions.close()
+        await self.album_batcher.close()
+        await self.media_pipeline.close(timeout=remaining(MEDIA_DRAIN_TIMEOUT))
+        if announce:
+            now = time.time()
+            await self.send_log(render('tracker_stopped', time=format_time(now)), kind='tracker_stopped', ts=now,
+                                block=True)
+        await self.media_store.close()
+        for sink in self.sinks:
+            await sink.close()
+        await self.log_queue.close(timeout=remaining(LOG_DRAIN_TIMEOUT))
+        if self.message_store:
+            await self.message_store.close()
+        self.save_unfinished()
+    
+    def save_unfinished(self):
+        logs = [job.text for job in self.log_queue.unfinished if isinstance(job, LogMessage)]
+        media = [job.dump() for job in self.media_pipeline.unfinished] + self.resuming
+        self.unfinished_work.save(logs, media)
+    
+    def request_shutdown(self):
+        """SIGTERM/SIGINT handler: start a graceful shutdown"""
+        if self.shutdown_requested.is_set():
+            print(f"⚠️  Already stopping; waiting up to {SHUTDOWN_TIMEOUT:.0f}s for queued work to drain")
+            return
+        print("\n\n⚠️  Stopping tracker...")
+        self.shutdown_requested.set()
+    
+    async def shutdown(self):
+        """Stop taking new events, drain within SHUTDOWN_TIMEOUT, then disconnect"""
+        # Anything that arrives from here on is picked up by the next start's catch-up
+        for callback in self.event_handlers:
+            self.client.remove_event_handler(callback)
+        await self.close(announce=True)
+        await self.client.disconnect()
+        print("✓ Tracker stopped successfully!")
     
     async def run(self):
         """Main run loop"""
-        if await self.start():
-            await self.client.run_until_disconnected()
-        else:
+        if not await self.start():
             print("\n✗ Failed to start tracker. Please check your configuration.")
+            return
+        disconnected = asyncio.ensure_future(self.client.run_until_disconnected())
+        stop = asyncio.create_task(self.shutdown_requested.wait())
+        await asyncio.wait({disconnected, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if disconnected.done():
+            # Lost the connection for good; save what cannot be sent
+            await self.close()
+        else:
+            # The connection stays up while queued work drains
+            await self.shutdown()
+        await disconnected
 
-async def main():
+async def main(profile_startup=False):
     """Main entry point"""
     # Validate only essential configuration
     if not TARGET_USER:
@@ -444,20 +855,42 @@ async def main():
         print("✗ Error: LOG_CHAT_ID must be set")
         return
     
-    tracker = TelegramTracker()
+    tracker = TelegramTracker(profile_startup=profile_startup)
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, tracker.request_shutdown)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still arrives as KeyboardInterrupt below
     
     try:
         await tracker.run()
     except KeyboardInterrupt:
         print("\n\n⚠️  Stopping tracker...")
-        await tracker.send_log(f"🛑 **Tracker Stopped**\n🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        await tracker.client.disconnect()
-        print("✓ Tracker stopped successfully!")
+        await tracker.shutdown()
     except Exception as e:
         print(f"\n✗ Fatal error: {e}")
         import traceback
         traceback.print_exc()
 
+def install_uvloop():
+    """Switch asyncio to uvloop's event loop if it is installed"""
+    try:
+        import uvloop
+    except ImportError:
+        print("⚠️  uvloop is not installed (pip install uvloop); using the default event loop")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Track a Telegram user's activity")
+    parser.add_argument('--uvloop', action='store_true', help='run on the uvloop event loop')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report time spent in imports, client.start(), entity resolution and handler registration')
+    args = parser.parse_args()
+    if args.uvloop or USE_UVLOOP:
+        install_uvloop()
+    asyncio.run(main(profile_startup=args.profile_startup))
 